@@ -0,0 +1,249 @@
+# Battleship
+# Benchmark and performance regression suite
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from Battleship import (BoardGeometry, DensityShooter, Game, RandomShooter, STANDARD_BOARD, get_random_position,
+                        simulate_batch)
+
+SEED = 2020
+BENCHMARK_BOARDS = (STANDARD_BOARD, BoardGeometry(26, 26), BoardGeometry(100, 100))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'battleship_benchmark.json')
+DEFAULT_THRESHOLD = 0.10
+REPEAT = 5
+MIN_TIME = 0.1
+SHOTS_PER_GAME = 50
+
+
+def _shot_plan(geometry, number):
+    """Creates fresh games and the positions to fire at, SHOTS_PER_GAME
+    distinct positions per game, number shots in total.
+
+    :return: list of (game, position) tuples
+    """
+    plan = []
+    while len(plan) < number:
+        game = Game(geometry=geometry)
+        positions = set()
+        while len(positions) < min(SHOTS_PER_GAME, geometry.num_cells):
+            positions.add(get_random_position(geometry))
+        plan.extend((game, position) for position in sorted(positions))
+    random.shuffle(plan)
+    return plan[:number]
+
+
+def bench_create_and_place_ships(geometry, number):
+    """Times Game.create_and_place_ships on number empty boards."""
+    games = [Game(geometry=geometry, fleet=[]) for _ in range(number)]
+    start = time.perf_counter()
+    for game in games:
+        game.create_and_place_ships()
+    return time.perf_counter() - start
+
+
+def bench_place_ship(geometry, number):
+    """Times Game.place_ship for a cruiser at number random positions of a
+    board with a full fleet."""
+    game = Game(geometry=geometry)
+    positions = [get_random_position(geometry) for _ in range(number)]
+    start = time.perf_counter()
+    for position in positions:
+        game.place_ship(position, 3)
+    return time.perf_counter() - start
+
+
+def bench_check_guess(geometry, number):
+    """Times Game.check_guess for number shots spread over fresh games."""
+    plan = _shot_plan(geometry, number)
+    start = time.perf_counter()
+    for game, position in plan:
+        game.check_guess(position)
+    return time.perf_counter() - start
+
+
+def bench_update_game(geometry, number):
+    """Times Game.update_game for number shots already checked with
+    check_guess."""
+    plan = [(game, position, game.check_guess(position)) for game, position in _shot_plan(geometry, number)]
+    start = time.perf_counter()
+    for game, position, status in plan:
+        game.update_game(status, position)
+    return time.perf_counter() - start
+
+
+def bench_is_complete(geometry, number):
+    """Times Game.is_complete on number games part way through play."""
+    plan = _shot_plan(geometry, number)
+    for game, position in plan:
+        game.update_game(game.check_guess(position), position)
+    games = [game for game, _ in plan]
+    start = time.perf_counter()
+    for game in games:
+        game.is_complete()
+    return time.perf_counter() - start
+
+
+def bench_games_random(geometry, number):
+    """Times number headless games played by RandomShooter."""
+    start = time.perf_counter()
+    simulate_batch(number, RandomShooter, SEED, geometry=geometry)
+    return time.perf_counter() - start
+
+
+def bench_games_density(geometry, number):
+    """Times number headless games played by DensityShooter."""
+    start = time.perf_counter()
+    simulate_batch(number, DensityShooter, SEED, geometry=geometry)
+    return time.perf_counter() - start
+
+
+BENCHMARKS = {
+    "create_and_place_ships": bench_create_and_place_ships,
+    "place_ship": bench_place_ship,
+    "check_guess": bench_check_guess,
+    "update_game": bench_update_game,
+    "is_complete": bench_is_complete,
+    "games_random": bench_games_random,
+    "games_density": bench_games_density,
+}
+# DensityShooter keeps its counts in bitboards, which sparse boards do not have
+DENSE_ONLY = {"games_density"}
+
+
+def measure(benchmark, geometry, repeat=REPEAT, min_time=MIN_TIME):
+    """Runs benchmark on geometry with the number of operations doubled
+    until one run takes at least min_time, then repeats it and keeps the
+    fastest run. Every run reseeds the random module with SEED, so all
+    runs time the same boards and shots.
+
+    :param benchmark: callable taking (geometry, number) and returning the seconds taken
+    :param geometry: BoardGeometry to benchmark on
+    :param repeat: number of timed runs
+    :param min_time: minimum duration of one run in seconds
+    :return: operations per second
+    """
+    number = 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        while True:
+            random.seed(SEED)
+            seconds = benchmark(geometry, number)
+            if seconds >= min_time:
+                break
+            number *= 2
+        best = seconds
+        for _ in range(repeat - 1):
+            random.seed(SEED)
+            best = min(best, benchmark(geometry, number))
+    return number / best
+
+
+def run_benchmarks(names=None, boards=BENCHMARK_BOARDS, repeat=REPEAT, min_time=MIN_TIME, report=None):
+    """Runs the named benchmarks (all when None) on every board they
+    support.
+
+    :param report: callable receiving (key, operations per second) as each result comes in
+    :return: dict of "name@ROWSxCOLS" keys mapped to operations per second
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        for geometry in boards:
+            if geometry.sparse and name in DENSE_ONLY:
+                continue
+            key = "{}@{}x{}".format(name, geometry.num_rows, geometry.num_cols)
+            results[key] = measure(BENCHMARKS[name], geometry, repeat, min_time)
+            if report is not None:
+                report(key, results[key])
+    return results
+
+
+def load_baseline(path=DEFAULT_BASELINE):
+    """Reads baseline results saved by save_baseline.
+
+    :return: dict of benchmark keys mapped to operations per second, None when path does not exist
+    """
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)["results"]
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results, path=DEFAULT_BASELINE):
+    """Writes results as the baseline later runs are compared against,
+    together with the interpreter and machine they were measured on.
+
+    :return: None
+    """
+    with open(path, 'w') as baseline_file:
+        json.dump({"python": platform.python_version(), "machine": platform.platform(), "results": results},
+                  baseline_file, indent=2, sort_keys=True)
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compares results against baseline. Benchmarks missing from either
+    side are ignored.
+
+    :param threshold: largest allowed drop in throughput as a fraction of the baseline
+    :return: list of (key, baseline, current) tuples for every benchmark that regressed
+    """
+    regressions = []
+    for key, current in results.items():
+        if key in baseline and current < baseline[key] * (1 - threshold):
+            regressions.append((key, baseline[key], current))
+    return regressions
+
+
+def main():
+    """Runs the benchmark suite and compares it with the stored baseline.
+    The baseline is created when it does not exist yet and replaced with
+    --update. Exits with status 1 when any benchmark is slower than the
+    baseline by more than the threshold."""
+
+    parser = argparse.ArgumentParser(description="Battleship benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, from {} (default all)".format(
+        ', '.join(BENCHMARKS)))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed throughput drop as a fraction (default {})".format(DEFAULT_THRESHOLD))
+    parser.add_argument("--update", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per benchmark")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: {}".format(', '.join(unknown)))
+
+    baseline = load_baseline(args.baseline)
+
+    def report(key, ops):
+        line = "{:<36} {:>14,.0f} ops/s".format(key, ops)
+        if baseline and key in baseline:
+            line += "  {:+.1%}".format(ops / baseline[key] - 1)
+        print(line)
+
+    results = run_benchmarks(args.names, repeat=args.repeat, report=report)
+
+    if baseline is None or args.update:
+        if baseline is not None:
+            baseline.update(results)
+            results = baseline
+        save_baseline(results, args.baseline)
+        print("Baseline written to {}".format(args.baseline))
+        return
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for key, before, after in regressions:
+        print("REGRESSION {}: {:,.0f} -> {:,.0f} ops/s".format(key, before, after))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
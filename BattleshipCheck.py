@@ -0,0 +1,180 @@
+# Battleship
+# Consistency checks of the bit-parallel code paths against straightforward implementations
+
+import argparse
+import random
+import sys
+from collections import Counter
+
+from Battleship import (BoardGeometry, Game, GameBatch, LayoutCounter, SHIP_SIZES, cells_mask, count_layouts,
+                        get_placement_index)
+
+SEED = 2020
+LAYOUT_BOARD = BoardGeometry(4, 5)
+# fleets checked by LayoutCounter, small enough to enumerate on LAYOUT_BOARD
+LAYOUT_FLEETS = (
+    ["destroyer"],
+    ["cruiser", "destroyer"],
+    ["cruiser", "submarine", "destroyer"],
+    ["battleship", "cruiser", "submarine", "destroyer"],
+)
+LAYOUT_POSITIONS = 12
+BATCH_BOARDS = (BoardGeometry(), BoardGeometry(7, 9))
+BATCH_GAMES = 40
+BATCH_MAX_MISSES = 25
+
+
+def brute_force_layouts(geometry, ship_types, hits=0, misses=0):
+    """Lists every layout of the ships consistent with hits and misses by
+    trying every combination of placements.
+
+    :param geometry: BoardGeometry of the board
+    :param ship_types: names of the ships to place
+    :param hits: bitmask of cells known to be occupied by these ships
+    :param misses: bitmask of cells known to be free of these ships
+    :return: list of layouts, each a tuple of (name, start_cell, orientation, mask) in ship_types order
+    """
+    placements = get_placement_index(geometry)
+    layouts = []
+
+    def place(index, occupied, placed):
+        if index == len(ship_types):
+            if hits & ~occupied == 0:
+                layouts.append(tuple(placed))
+            return
+        name = ship_types[index]
+        for mask, start, orientation in placements[SHIP_SIZES[name]]:
+            if not mask & (occupied | misses):
+                placed.append((name, start, orientation, mask))
+                place(index + 1, occupied | mask, placed)
+                placed.pop()
+
+    place(0, 0, [])
+    return layouts
+
+
+def _random_position(geometry, ship_types, rng):
+    """Fires random shots at a random layout of ship_types.
+
+    :return: (hits, misses) bitmasks of a position reachable in play
+    """
+    layouts = brute_force_layouts(geometry, ship_types)
+    occupied = 0
+    for _, _, _, mask in rng.choice(layouts):
+        occupied |= mask
+    shots = cells_mask(rng.sample(range(geometry.num_cells), rng.randrange(geometry.num_cells // 2)))
+    return shots & occupied, shots & ~occupied
+
+
+def check_layout_counter(geometry, ship_types, hits, misses):
+    """Compares LayoutCounter.count, cell_counts and layouts, and
+    count_layouts over several processes, with brute force.
+
+    :return: list of failure messages
+    """
+    expected = brute_force_layouts(geometry, ship_types, hits, misses)
+    expected_cells = [0] * geometry.num_cells
+    for layout in expected:
+        for _, _, _, mask in layout:
+            for cell in range(geometry.num_cells):
+                expected_cells[cell] += mask >> cell & 1
+    expected_layouts = Counter(frozenset(placement[:3] for placement in layout) for layout in expected)
+
+    label = "{} hits={:#x} misses={:#x}".format(','.join(ship_types), hits, misses)
+    failures = []
+    counter = LayoutCounter(geometry, ship_types, hits, misses)
+    if counter.count() != len(expected):
+        failures.append("{}: count {} != {}".format(label, counter.count(), len(expected)))
+    total, cells = counter.cell_counts()
+    if (total, cells) != (len(expected), expected_cells):
+        failures.append("{}: cell_counts {} {} != {} {}".format(label, total, cells, len(expected), expected_cells))
+    if Counter(frozenset(layout) for layout in counter.layouts()) != expected_layouts:
+        failures.append("{}: layouts differ".format(label))
+    if len(ship_types) > 1 and count_layouts(geometry, ship_types, hits, misses, processes=2,
+                                             cell_counts=True) != (len(expected), expected_cells):
+        failures.append("{}: count_layouts over processes differs".format(label))
+    return failures
+
+
+def check_layouts(geometry=LAYOUT_BOARD, fleets=LAYOUT_FLEETS, positions=LAYOUT_POSITIONS, seed=SEED):
+    """Runs check_layout_counter for every fleet on the empty board and on
+    random positions reached by firing at a random layout.
+
+    :return: list of failure messages
+    """
+    rng = random.Random(seed)
+    failures = []
+    for ship_types in fleets:
+        failures.extend(check_layout_counter(geometry, ship_types, 0, 0))
+        for _ in range(positions):
+            hits, misses = _random_position(geometry, ship_types, rng)
+            failures.extend(check_layout_counter(geometry, ship_types, hits, misses))
+    return failures
+
+
+def check_game_batch(geometry, num_games=BATCH_GAMES, max_misses=BATCH_MAX_MISSES, seed=SEED):
+    """Plays games with Game and the same fleets with GameBatch in lock
+    step, firing random cells (repeats included, some boards skipping a
+    turn), and compares hits, sunk ships, wins, losses and the miss and
+    shot counters after every turn.
+
+    :return: list of failure messages
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    games = [Game(max_misses, geometry) for _ in range(num_games)]
+    batch = GameBatch(max_misses=max_misses, games=games)
+    label = "{}x{}".format(geometry.num_rows, geometry.num_cols)
+    turn = 0
+    while not batch.is_complete():
+        turn += 1
+        cells = [None if rng.random() < 0.1 else rng.randrange(geometry.num_cells) for _ in games]
+        expected_hits = []
+        for game, cell in zip(games, cells):
+            if cell is None or game.is_won() or game.is_lost():
+                expected_hits.append(False)
+                continue
+            ship = game.check_cell(cell)
+            game.update_cell(ship is not None, cell)
+            expected_hits.append(ship is not None)
+
+        checks = (
+            ("hits", batch.flags_to_list(batch.apply(cells)), expected_hits),
+            ("won", batch.flags_to_list(batch.won), [game.is_won() for game in games]),
+            ("lost", batch.flags_to_list(batch.lost), [game.is_lost() and not game.is_won() for game in games]),
+            ("misses", batch.counts_to_list(batch.miss_planes), [game.num_misses for game in games]),
+            ("shots", batch.counts_to_list(batch.shot_planes), [len(game.shots) for game in games]),
+        )
+        checks += tuple(("sunk " + name, batch.flags_to_list(batch.sunk[i]), [game.ships[i].sunk for game in games])
+                        for i, name in enumerate(Game._ship_types))
+        for name, actual, expected in checks:
+            if actual != expected:
+                return ["{} turn {}: {} {} != {}".format(label, turn, name, actual, expected)]
+        if turn > 100 * geometry.num_cells:
+            return ["{}: batch never completed".format(label)]
+    return []
+
+
+def main():
+    """Runs every check and exits with status 1 when any fails."""
+
+    parser = argparse.ArgumentParser(description="Battleship consistency checks")
+    parser.add_argument("--seed", type=int, default=SEED, help="seed of the random positions and shots")
+    args = parser.parse_args()
+
+    failures = []
+    results = [("LayoutCounter", check_layouts(seed=args.seed))]
+    for geometry in BATCH_BOARDS:
+        results.append(("GameBatch {}x{}".format(geometry.num_rows, geometry.num_cols),
+                        check_game_batch(geometry, seed=args.seed)))
+    for name, check_failures in results:
+        print("{:<20} {}".format(name, "FAILED" if check_failures else "ok"))
+        failures.extend(check_failures)
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
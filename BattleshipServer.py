@@ -0,0 +1,254 @@
+# Battleship
+# Asyncio line-protocol server hosting one Battleship game per connection
+
+import asyncio
+import sys
+import time
+
+from Battleship import Game, MAX_MISSES, RandomShooter, STANDARD_BOARD
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8007
+GUESS_PROMPT = "Enter a row and a column:"
+AGAIN_PROMPT = "Play again (Y/N)?"
+PROMPTS = (GUESS_PROMPT, AGAIN_PROMPT)
+
+
+async def _send(writer, lines):
+    """Writes lines to the client, one per line, and waits for the
+    transport to drain so a slow client cannot buffer unbounded output.
+
+    :param writer: asyncio StreamWriter of the connection
+    :param lines: strings to send
+    :return: None
+    """
+    writer.write(('\n'.join(lines) + '\n').encode())
+    await writer.drain()
+
+
+async def _read_line(reader):
+    """Reads one line from the client.
+
+    :param reader: asyncio StreamReader of the connection
+    :return: the line without its line ending, None once the client disconnects
+    """
+    try:
+        line = await reader.readline()
+    except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+        return None
+    if not line:
+        return None
+    return line.decode(errors='replace').strip()
+
+
+async def play_session(reader, writer, max_misses=MAX_MISSES, geometry=STANDARD_BOARD):
+    """Plays Battleship games over one connection until the client declines
+    another round, sends QUIT or disconnects. This is play_battleship with
+    guesses read from the socket and the board sent back instead of printed.
+
+    :param reader: asyncio StreamReader of the connection
+    :param writer: asyncio StreamWriter of the connection
+    :param max_misses: misses allowed per game
+    :param geometry: BoardGeometry of the games played
+    :return: number of games completed
+    """
+    games_played = 0
+    try:
+        await _send(writer, ["Let's Play Battleship!", ""])
+        while True:
+            game = Game(max_misses, geometry)
+            await _send(writer, [game.render_board(), GUESS_PROMPT])
+
+            while not (game.is_won() or game.is_lost()):
+                line = await _read_line(reader)
+                if line is None or line.upper() == "QUIT":
+                    return games_played
+                position = geometry.parse_position(line)
+                if position is None:
+                    await _send(writer, ["Invalid guess: {!r}".format(line), GUESS_PROMPT])
+                    continue
+
+                cell = geometry.position_to_cell(position)
+                ship = game.check_cell(cell)
+                game.update_cell(ship is not None, cell)
+
+                lines = []
+                if ship is not None and ship.sunk:
+                    lines.append("You sunk the {}!".format(ship.name))
+                lines.append(game.render_board())
+                if game.is_won():
+                    lines.append("YOU WIN!")
+                elif game.is_lost():
+                    lines.append("SORRY! NO GUESSES LEFT.")
+                else:
+                    lines.append(GUESS_PROMPT)
+                await _send(writer, lines)
+
+            games_played += 1
+            await _send(writer, [AGAIN_PROMPT])
+            answer = await _read_line(reader)
+            while answer is not None and answer not in ["N", "n", "Y", "y"]:
+                await _send(writer, [AGAIN_PROMPT])
+                answer = await _read_line(reader)
+            if answer is None:
+                return games_played
+            if answer in ["N", "n"]:
+                await _send(writer, ["Goodbye."])
+                return games_played
+    except ConnectionError:
+        return games_played
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def start_server(host=DEFAULT_HOST, port=DEFAULT_PORT, max_misses=MAX_MISSES, geometry=STANDARD_BOARD,
+                       backlog=4096):
+    """Starts listening for Battleship clients. Every connection is served by
+    its own play_session task on the running event loop, so the number of
+    simultaneous players is bounded by open sockets rather than threads.
+
+    :param host: interface to listen on
+    :param port: TCP port, 0 to pick a free one
+    :param max_misses: misses allowed per game
+    :param geometry: BoardGeometry of the games played
+    :param backlog: listen queue length, large enough for bursts of connects
+    :return: the asyncio Server
+    """
+    async def handle(reader, writer):
+        await play_session(reader, writer, max_misses, geometry)
+
+    return await asyncio.start_server(handle, host, port, backlog=backlog)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, max_misses=MAX_MISSES, geometry=STANDARD_BOARD):
+    """Runs the Battleship server until cancelled.
+
+    :return: None
+    """
+    server = await start_server(host, port, max_misses, geometry)
+    async with server:
+        print("Serving Battleship on {}".format(
+            ', '.join('{}:{}'.format(*sock.getsockname()[:2]) for sock in server.sockets)))
+        await server.serve_forever()
+
+
+class Client:
+    """Scripted Battleship client for testing the server. It reads server
+    output up to the next prompt and answers guesses from a shooter, using
+    the same shooter protocol as Battleship.play_headless: a shooter is
+    created per game by calling shooter_factory(game) and returns the next
+    cell to fire at when called with the game. The client's game is a
+    local stand-in without ships that only supplies the board geometry.
+    """
+
+    def __init__(self, shooter_factory, geometry=STANDARD_BOARD, rounds=1):
+        self.shooter_factory = shooter_factory
+        self.geometry = geometry
+        self.rounds = rounds
+        self.guesses = 0
+        self.wins = 0
+        self.losses = 0
+
+    async def _read_until_prompt(self, reader):
+        """Reads lines until the server asks for input.
+
+        :return: (lines read, prompt) where prompt is None on disconnect
+        """
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return lines, None
+            line = line.decode().rstrip('\n')
+            if line in PROMPTS:
+                return lines, line
+            lines.append(line)
+
+    async def run(self, host, port):
+        """Connects to the server and plays self.rounds games.
+
+        :return: self
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            rounds_left = self.rounds
+            game = shooter = None
+            while True:
+                lines, prompt = await self._read_until_prompt(reader)
+                if "YOU WIN!" in lines:
+                    self.wins += 1
+                elif "SORRY! NO GUESSES LEFT." in lines:
+                    self.losses += 1
+                if prompt is None:
+                    break
+                if prompt == AGAIN_PROMPT:
+                    rounds_left -= 1
+                    shooter = None
+                    writer.write(b"Y\n" if rounds_left > 0 else b"N\n")
+                    continue
+                if shooter is None:
+                    game = Game(geometry=self.geometry, fleet=[])
+                    shooter = self.shooter_factory(game)
+                row, col = self.geometry.cell_to_position(shooter(game))
+                writer.write("{} {}\n".format(row, col).encode())
+                self.guesses += 1
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+        return self
+
+
+async def load_test(num_clients, rounds=1, host=DEFAULT_HOST, port=0, max_misses=MAX_MISSES,
+                    geometry=STANDARD_BOARD, shooter_factory=RandomShooter):
+    """Starts a server in this process and plays num_clients simultaneous
+    sessions against it.
+
+    :param num_clients: number of concurrent connections
+    :param rounds: games played per connection
+    :param port: server port, 0 to pick a free one
+    :return: dict with clients, games, wins, guesses, seconds and guesses_per_second
+    """
+    server = await start_server(host, port, max_misses, geometry)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        start = time.perf_counter()
+        clients = await asyncio.gather(*(Client(shooter_factory, geometry, rounds).run(host, port)
+                                         for _ in range(num_clients)))
+        seconds = time.perf_counter() - start
+    guesses = sum(client.guesses for client in clients)
+    return {
+        "clients": num_clients,
+        "games": sum(client.wins + client.losses for client in clients),
+        "wins": sum(client.wins for client in clients),
+        "guesses": guesses,
+        "seconds": seconds,
+        "guesses_per_second": guesses / seconds if seconds else 0.0,
+    }
+
+
+def main():
+    """Serves Battleship on DEFAULT_PORT (or the port given as the only
+    argument), or with the arguments "loadtest N" plays N concurrent
+    scripted sessions against an in-process server and prints the results."""
+
+    if len(sys.argv) == 3 and sys.argv[1] == "loadtest":
+        results = asyncio.run(load_test(int(sys.argv[2])))
+        for key, value in results.items():
+            print("{}: {}".format(key, round(value, 2) if isinstance(value, float) else value))
+    else:
+        port = int(sys.argv[1]) if len(sys.argv) == 2 else DEFAULT_PORT
+        try:
+            asyncio.run(serve(port=port))
+        except KeyboardInterrupt:
+            print("Goodbye.")
+
+
+if __name__ == "__main__":
+    main()
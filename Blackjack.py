@@ -3,19 +3,152 @@
 # Date due: 2020-11-06
 
 
+import functools
+import hashlib
+import math
+import multiprocessing
+import os
 import random
+import sys
+import tempfile
+from array import array
 
 CARD_LABELS = ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K')
 BLACKJACK = 21
 DEALER_THRESHOLD = 16
+CARDS_PER_RANK = 4
+DEFAULT_DECKS = 6
+DEFAULT_PENETRATION = 0.75
+CARD_VALUE_TABLE = dict(zip(CARD_LABELS, (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)))
+SOFT_ACE_BONUS = 10
+WIN = 1
+LOSE = -1
 
 
-def deal_card():
+class Shoe:
+    """A shoe of num_decks decks. Cards are kept as rank indices into
+    CARD_LABELS: the cards in a bytearray whose first position entries have
+    been dealt, and the cards left of every rank in an array of counts.
+
+    The shoe is shuffled lazily, one Fisher-Yates step per card drawn: a
+    draw swaps a random undealt card to the front of the undealt part and
+    deals it. Every order is as likely as with a full shuffle, a reshuffle
+    only resets the counts, and dealing costs the same per card whether
+    cards are drawn one at a time or in batches. When the cut card placed
+    at penetration of the shoe has been passed, shuffle_if_needed
+    reshuffles all cards before the next hand.
+    """
+
+    def __init__(self, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION, rng=None):
+        """
+        :param num_decks: number of 52-card decks in the shoe
+        :param penetration: fraction of the shoe dealt before the cut card
+        :param rng: random.Random used for shuffling, a new one when None
+        """
+        if num_decks < 1 or not 0 < penetration <= 1:
+            raise ValueError("a shoe needs at least one deck and a penetration in (0, 1]")
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.size = num_decks * CARDS_PER_RANK * len(CARD_LABELS)
+        self.cut_card = max(1, int(self.size * penetration))
+        self.random = rng if rng is not None else random.Random()
+        self.cards = bytearray(rank for rank in range(len(CARD_LABELS))
+                               for _ in range(num_decks * CARDS_PER_RANK))
+        self.counts = None
+        self.position = 0
+        self.shuffles = 0
+        self.shuffle()
+
+    def shuffle(self):
+        """Returns all cards to the shoe and shuffles it.
+
+        :return: None
+        """
+        self.counts = array('H', [self.num_decks * CARDS_PER_RANK] * len(CARD_LABELS))
+        self.position = 0
+        self.shuffles += 1
+
+    @property
+    def remaining(self):
+        """Number of cards left in the shoe."""
+        return self.size - self.position
+
+    def needs_shuffle(self):
+        """Checks whether the cut card has been reached.
+
+        :return: True when the shoe should be reshuffled before the next hand
+        """
+        return self.position >= self.cut_card
+
+    def shuffle_if_needed(self):
+        """Reshuffles the shoe when the cut card has been reached. Call it
+        between hands, never during one.
+
+        :return: True when the shoe was reshuffled, False otherwise
+        """
+        if self.position >= self.cut_card:
+            self.shuffle()
+            return True
+        return False
+
+    def draw(self):
+        """Removes a random card from the shoe, reshuffling first should
+        the shoe be empty.
+
+        :return: the rank index of the card in CARD_LABELS
+        """
+        position = self.position
+        if position == self.size:
+            self.shuffle()
+            position = 0
+        cards = self.cards
+        pick = position + int(self.random.random() * (self.size - position))
+        rank = cards[pick]
+        cards[pick] = cards[position]
+        cards[position] = rank
+        self.position = position + 1
+        self.counts[rank] -= 1
+        return rank
+
+    def draw_many(self, num_cards):
+        """Removes num_cards random cards from the shoe at once. When fewer
+        cards are left, the shoe is reshuffled and the rest are drawn from
+        the new shoe.
+
+        :param num_cards: number of cards to draw
+        :return: bytearray of rank indices in CARD_LABELS, in the order drawn
+        """
+        drawn = bytearray(num_cards)
+        cards = self.cards
+        counts = self.counts
+        size = self.size
+        random_fraction = self.random.random
+        position = self.position
+        for i in range(num_cards):
+            if position == size:
+                self.shuffle()
+                counts = self.counts
+                position = 0
+            pick = position + int(random_fraction() * (size - position))
+            rank = cards[pick]
+            cards[pick] = cards[position]
+            cards[position] = rank
+            position += 1
+            counts[rank] -= 1
+            drawn[i] = rank
+        self.position = position
+        return drawn
+
+
+def deal_card(shoe=None):
     """Evaluates to a character representing one of 13
     cards in the CARD_LABELS tuple
 
+    :param shoe: Shoe to draw from, an infinite deck when None
     :return: a single- or double-character string representing a playing card
     """
+    if shoe is not None:
+        return CARD_LABELS[shoe.draw()]
     card_label = random.choice(CARD_LABELS)
     return card_label
 
@@ -27,26 +160,78 @@ def get_card_value(card_label):
     :param card_label: a single- or double-character string representing a card
     :return: an int representing the card's value
     """
+    return CARD_VALUE_TABLE[card_label]
 
-    if card_label == "J" or card_label == "K" or card_label == "Q":
-        card_label = 10
-    if card_label == "A":
-        card_label = 1
-    card_label = int(card_label)
 
-    return card_label
+class Hand:
+    """Running totals of a hand of cards. Aces are added as 1 to the hard
+    total; while the hand holds an ace and counting one of them as 11 keeps
+    it at or below BLACKJACK, the best total does so and the hand is soft.
+    All totals are updated as each card is added, without keeping the
+    cards themselves.
+    """
+
+    __slots__ = ('hard_total', 'aces', 'total', 'soft')
+
+    def __init__(self, *card_labels):
+        """
+        :param card_labels: labels of the cards initially in the hand
+        """
+        self.hard_total = 0
+        self.aces = 0
+        self.total = 0
+        self.soft = False
+        for card_label in card_labels:
+            self.add_value(CARD_VALUE_TABLE[card_label])
+
+    def __repr__(self):
+        return "Hand(total={}, soft={})".format(self.total, self.soft)
+
+    def add(self, card_label):
+        """Adds the card with the given label to the hand.
+
+        :param card_label: a label from CARD_LABELS
+        :return: the hand's best total
+        """
+        return self.add_value(CARD_VALUE_TABLE[card_label])
+
+    def add_value(self, value):
+        """Adds a card of the given value (1 for an ace) to the hand.
+
+        :param value: the card's value from get_card_value
+        :return: the hand's best total
+        """
+        hard_total = self.hard_total + value
+        self.hard_total = hard_total
+        if value == 1:
+            self.aces += 1
+        if self.aces and hard_total + SOFT_ACE_BONUS <= BLACKJACK:
+            self.total = hard_total + SOFT_ACE_BONUS
+            self.soft = True
+        else:
+            self.total = hard_total
+            self.soft = False
+        return self.total
+
+    def is_bust(self):
+        """:return: True when the best total is over BLACKJACK"""
+        return self.total > BLACKJACK
 
-def deal_cards_to_player():
+
+def deal_cards_to_player(shoe=None):
     """Deals cards to the player and returns the card
     total
 
+    Answering "?" to the hit or stay question shows the advice of the
+    strategy table for the current total.
+
+    :param shoe: Shoe to deal from, an infinite deck when None
     :return: the total value of the cards dealt
     """
-    player_label_1 = deal_card()
-    player_label_2 = deal_card()
-    player_card_1 = get_card_value(player_label_1)
-    player_card_2 = get_card_value(player_label_2)
-    player_total = player_card_1 + player_card_2
+    player_label_1 = deal_card(shoe)
+    player_label_2 = deal_card(shoe)
+    hand = Hand(player_label_1, player_label_2)
+    player_total = hand.total
     print("Player drew {} and {}.\nPlayer's total is {}.\n".format(str(player_label_1), str(player_label_2),
                                                                     str(player_total)))
     change_card = None
@@ -55,34 +240,34 @@ def deal_cards_to_player():
         while change_card not in ("s", "h"):
             change_card = input("Hit (h) or Stay (s)? ")
             print()
+            if change_card == "?":
+                print(get_strategy().advice(player_total, hand.soft) + "\n")
         if change_card == "h":
-            player_extra_label = deal_card()
-            player_extra = get_card_value(player_extra_label)
-            player_total += player_extra
+            player_extra_label = deal_card(shoe)
+            player_total = hand.add(player_extra_label)
             print("Player drew {}.\nPlayer's total is {}.\n".format(str(player_extra_label), str(player_total)))
 
     return player_total
 
 
-def deal_cards_to_dealer():
+def deal_cards_to_dealer(shoe=None):
     """Deals cards to the dealer and returns the card
     total
 
+    :param shoe: Shoe to deal from, an infinite deck when None
     :return: the total value of the cards dealt
     """
 
-    dealer_label_1 = deal_card()
-    dealer_label_2 = deal_card()
-    dealer_card_1 = get_card_value(dealer_label_1)
-    dealer_card_2 = get_card_value(dealer_label_2)
-    dealer_total = dealer_card_1 + dealer_card_2
+    dealer_label_1 = deal_card(shoe)
+    dealer_label_2 = deal_card(shoe)
+    hand = Hand(dealer_label_1, dealer_label_2)
+    dealer_total = hand.total
     print("The dealer has {} and {}.\nDealer's total is {}.\n".format(str(dealer_label_1), str(dealer_label_2),
                                                                        str(dealer_total)))
 
     while dealer_total <= DEALER_THRESHOLD:
-        dealer_extra_label = deal_card()
-        dealer_extra = get_card_value(dealer_extra_label)
-        dealer_total += dealer_extra
+        dealer_extra_label = deal_card(shoe)
+        dealer_total = hand.add(dealer_extra_label)
         print("Dealer drew {}.\nDealer's total is {}.\n".format(str(dealer_extra_label), str(dealer_total)))
 
     return dealer_total
@@ -97,26 +282,46 @@ def determine_outcome(player_total, dealer_total):
     :param dealer_total: total value of cards drawn by dealer
     :return: None
     """
-    # when they equal
-    if dealer_total < player_total <= BLACKJACK or dealer_total > BLACKJACK:
+    if hand_result(player_total, dealer_total) == WIN:
         print("YOU WIN!\n")
-    if player_total > BLACKJACK or player_total <= dealer_total <= BLACKJACK:
+    else:
         print("YOU LOSE!\n")
 
 
+def hand_result(player_total, dealer_total):
+    """Scores a finished hand: the player loses on a bust or when the dealer
+    stays on an equal or higher total, and wins otherwise. Ties go to the
+    dealer, so there are no pushes.
+
+    :param player_total: total value of cards drawn by player
+    :param dealer_total: total value of cards drawn by dealer
+    :return: WIN or LOSE
+    """
+    if player_total > BLACKJACK:
+        return LOSE
+    if dealer_total > BLACKJACK or dealer_total < player_total:
+        return WIN
+    return LOSE
+
 
 # When the player's total is over 21 (`BLACKJACK`), the player loses.
 # Furthermore, the dealer should not be dealt any cards when the player busts (receives a card total greater than 21).
 # When the dealer's total is over 21, the player wins (as long as the player's total is 21 or under).
 
 
-def play_blackjack():
+def play_blackjack(shoe=None):
+    """Plays rounds of Blackjack until the player declines another one.
+
+    :param shoe: Shoe to deal from, reshuffled between rounds once the cut card
+        is reached, an infinite deck when None
+    :return: None
+    """
     print("Let's Play Blackjack!\n")
-    player_total = deal_cards_to_player()
+    player_total = deal_cards_to_player(shoe)
     if player_total > BLACKJACK:
         dealer_total = DEALER_THRESHOLD
     else:
-        dealer_total = deal_cards_to_dealer()
+        dealer_total = deal_cards_to_dealer(shoe)
     determine_outcome(player_total, dealer_total)
 
     another_round = None
@@ -126,11 +331,13 @@ def play_blackjack():
             another_round = input("Play again (Y/N)? ")
             print()
         if another_round == "Y":
-            player_total = deal_cards_to_player()
+            if shoe is not None and shoe.shuffle_if_needed():
+                print("Shuffling the shoe.\n")
+            player_total = deal_cards_to_player(shoe)
             if player_total > BLACKJACK:
                 dealer_total = DEALER_THRESHOLD
             else:
-                dealer_total = deal_cards_to_dealer()
+                dealer_total = deal_cards_to_dealer(shoe)
             determine_outcome(player_total, dealer_total)
         else:
             print("Goodbye.")
@@ -138,11 +345,844 @@ def play_blackjack():
 
 ####### DO NOT EDIT ABOVE ########
 
+RANK_VALUES = tuple(CARD_VALUE_TABLE[card_label] for card_label in CARD_LABELS)
+# card values in ascending order, and how many ranks of CARD_LABELS have each
+CARD_VALUES = tuple(sorted(set(RANK_VALUES)))
+VALUE_RANKS = tuple(RANK_VALUES.count(value) for value in CARD_VALUES)
+DEALER_BUST = 'bust'
+DEALER_OUTCOMES = tuple(range(DEALER_THRESHOLD + 1, BLACKJACK + 1)) + (DEALER_BUST,)
+DEALER_CACHE_SIZE = 1 << 18
+# bytes.translate table from rank indices to card values
+RANK_VALUE_TABLE = bytes(RANK_VALUES) + bytes(256 - len(RANK_VALUES))
+# cards drawn at a time from an infinite deck by the batched simulator
+INFINITE_BLOCK = 1 << 14
+# Hi-Lo counting tags per rank index of CARD_LABELS: 2-6 count +1, 10-K and aces -1
+HI_LO_TAGS = (-1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1)
+TRUE_COUNT_LIMIT = 10
+# strategy table rows are (player total, soft) pairs and its columns dealer
+# upcard values, None standing for an upcard the player has not seen
+STRATEGY_ROWS = (tuple((total, False) for total in range(4, BLACKJACK))
+                 + tuple((total, True) for total in range(12, BLACKJACK)))
+STRATEGY_UPCARDS = CARD_VALUES + (None,)
+STRATEGY_MAGIC = b"BJS1"
+STRATEGY_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+class InfiniteShoe:
+    """Stand-in for Shoe that deals from an infinite deck like deal_card
+    without a shoe: every rank is equally likely on every draw."""
+
+    def __init__(self, rng=None):
+        self.random = rng if rng is not None else random.Random()
+
+    def draw(self):
+        """:return: the rank index in CARD_LABELS of a random card"""
+        return int(self.random.random() * len(CARD_LABELS))
+
+    def draw_many(self, num_cards):
+        """:return: bytearray of the rank indices in CARD_LABELS of num_cards random cards"""
+        random_fraction = self.random.random
+        num_ranks = len(CARD_LABELS)
+        return bytearray([int(random_fraction() * num_ranks) for _ in range(num_cards)])
+
+    def shuffle_if_needed(self):
+        """An infinite deck never needs shuffling.
+
+        :return: False
+        """
+        return False
+
+
+class StandOnPolicy:
+    """Player policy that hits until the total reaches stand_on.
+
+    A policy is a callable that takes the player's best total and whether
+    it is soft, and returns True to hit and False to stay. The player never
+    hits at BLACKJACK or above, whatever the policy says, as in
+    deal_cards_to_player.
+    """
+
+    def __init__(self, stand_on=DEALER_THRESHOLD + 1):
+        self.stand_on = stand_on
+
+    def __call__(self, player_total, soft):
+        return player_total < self.stand_on
+
+
+def value_counts(counts):
+    """Groups cards left per rank into cards left per value, the only
+    thing the odds depend on.
+
+    :param counts: cards left per rank index of CARD_LABELS, such as Shoe.counts
+    :return: tuple of cards left per value in CARD_VALUES
+    """
+    grouped = [0] * len(CARD_VALUES)
+    for rank, count in enumerate(counts):
+        grouped[CARD_VALUES.index(RANK_VALUES[rank])] += count
+    return tuple(grouped)
+
+
+def dealer_distribution(total=0, soft=False, counts=None):
+    """Computes the exact probability distribution of the dealer's final
+    total when the dealer, holding total, keeps drawing while at or below
+    DEALER_THRESHOLD as in deal_cards_to_dealer. A total of 0 stands for
+    the dealer's whole hand, both initial cards included.
+
+    Aces are counted as in Hand: one ace counts 11 while that keeps the
+    total at or below BLACKJACK, and soft says that total already counts
+    an ace that way. A shoe that runs out of cards part way is treated as
+    an infinite deck from then on.
+
+    :param total: dealer's current total
+    :param soft: True when total counts an ace as 11
+    :param counts: cards left per rank index of CARD_LABELS (such as
+        Shoe.counts), None for an infinite deck
+    :return: dict mapping each of DEALER_OUTCOMES to its probability
+    """
+    if counts is not None:
+        counts = value_counts(counts)
+    return dict(zip(DEALER_OUTCOMES, _dealer_probabilities(total, soft, counts)))
+
+
+def _add_card_value(total, soft, value):
+    """Adds a card of the given value to a hand known only by its best
+    total and softness, the transition Hand.add_value makes.
+
+    :return: (total, soft) of the hand with the card added
+    """
+    total += value
+    if soft and total > BLACKJACK:
+        return total - SOFT_ACE_BONUS, False
+    if value == 1 and not soft and total + SOFT_ACE_BONUS <= BLACKJACK:
+        return total + SOFT_ACE_BONUS, True
+    return total, soft
+
+
+@functools.lru_cache(maxsize=DEALER_CACHE_SIZE)
+def _dealer_probabilities(total, soft, counts):
+    """Recursive step of dealer_distribution. Results are memoized in a
+    bounded LRU cache keyed by (total, soft, counts), so questions about
+    the same or overlapping shoe compositions share their subtrees.
+
+    :param counts: cards left per value in CARD_VALUES, None for an infinite deck
+    :return: tuple of probabilities in the order of DEALER_OUTCOMES
+    """
+    if total > DEALER_THRESHOLD:
+        probabilities = [0.0] * len(DEALER_OUTCOMES)
+        probabilities[min(total, BLACKJACK + 1) - DEALER_THRESHOLD - 1] = 1.0
+        return tuple(probabilities)
+
+    if counts is not None and not any(counts):
+        counts = None
+    if counts is None:
+        weights = VALUE_RANKS
+    else:
+        weights = counts
+    remaining = sum(weights)
+    probabilities = [0.0] * len(DEALER_OUTCOMES)
+    for index, weight in enumerate(weights):
+        if not weight:
+            continue
+        if counts is None:
+            rest = None
+        else:
+            rest = counts[:index] + (weight - 1,) + counts[index + 1:]
+        child = _dealer_probabilities(*_add_card_value(total, soft, CARD_VALUES[index]) + (rest,))
+        chance = weight / remaining
+        for outcome, probability in enumerate(child):
+            probabilities[outcome] += chance * probability
+    return tuple(probabilities)
+
+
+def _stand_ev(player_total, upcard):
+    """Expected units won by staying on player_total against an
+    infinite-deck dealer showing upcard (None when unseen)."""
+    if upcard is None:
+        dealer = _dealer_probabilities(0, False, None)
+    else:
+        dealer = _dealer_probabilities(*_add_card_value(0, False, upcard) + (None,))
+    ev = 0.0
+    for outcome, probability in zip(DEALER_OUTCOMES, dealer):
+        dealer_total = BLACKJACK + 1 if outcome == DEALER_BUST else outcome
+        ev += probability * hand_result(player_total, dealer_total)
+    return ev
+
+
+def _hit_ev(player_total, soft, upcard):
+    """Expected units won by taking one card at player_total and then
+    playing on optimally."""
+    ev = 0.0
+    for value, ranks in zip(CARD_VALUES, VALUE_RANKS):
+        ev += ranks / len(CARD_LABELS) * _best_ev(*_add_card_value(player_total, soft, value) + (upcard,))
+    return ev
+
+
+@functools.lru_cache(maxsize=None)
+def _best_ev(player_total, soft, upcard):
+    """Expectimax value of a player hand: the better of staying and hitting,
+    where hitting averages over the next card. The player cannot hit at
+    BLACKJACK or above, as in deal_cards_to_player."""
+    if player_total > BLACKJACK:
+        return float(LOSE)
+    stand = _stand_ev(player_total, upcard)
+    if player_total == BLACKJACK:
+        return stand
+    return max(stand, _hit_ev(player_total, soft, upcard))
+
+
+def strategy_key():
+    """Identifies the rules a strategy table was computed for, so a cached
+    table is never used after BLACKJACK, DEALER_THRESHOLD or the card
+    values change.
+
+    :return: hex string
+    """
+    rules = (BLACKJACK, DEALER_THRESHOLD, RANK_VALUES, SOFT_ACE_BONUS, WIN, LOSE, STRATEGY_ROWS, STRATEGY_UPCARDS)
+    return hashlib.sha1(repr(rules).encode()).hexdigest()[:16]
+
+
+class StrategyTable:
+    """EV-maximizing hit/stay decisions for every player total, soft flag
+    and dealer upcard (STRATEGY_ROWS x STRATEGY_UPCARDS) against an
+    infinite deck. For every entry the table keeps the expected units won
+    by staying and by hitting, in an array of floats."""
+
+    def __init__(self, evs=None):
+        """
+        :param evs: array('d') of (stay, hit) EV pairs in row-major order, computed when None
+        """
+        if evs is None:
+            evs = array('d')
+            for player_total, soft in STRATEGY_ROWS:
+                for upcard in STRATEGY_UPCARDS:
+                    evs.append(_stand_ev(player_total, upcard))
+                    evs.append(_hit_ev(player_total, soft, upcard))
+        self.evs = evs
+
+    def _index(self, player_total, soft, upcard):
+        return 2 * (STRATEGY_ROWS.index((player_total, soft)) * len(STRATEGY_UPCARDS)
+                    + STRATEGY_UPCARDS.index(upcard))
+
+    def expected_values(self, player_total, soft=False, upcard=None):
+        """:return: (stay EV, hit EV) of the hand in units bet"""
+        index = self._index(player_total, soft, upcard)
+        return self.evs[index], self.evs[index + 1]
+
+    def should_hit(self, player_total, soft=False, upcard=None):
+        """Looks up the best decision for a hand. Totals of BLACKJACK or
+        more always stay.
+
+        :param player_total: player's total
+        :param soft: True when the total counts an ace as 11
+        :param upcard: value of the dealer's upcard, None when unseen
+        :return: True to hit, False to stay
+        """
+        if player_total >= BLACKJACK:
+            return False
+        stay, hit = self.expected_values(player_total, soft, upcard)
+        return hit > stay
+
+    def advice(self, player_total, soft=False, upcard=None):
+        """Returns the best decision for a hand as a sentence for the player."""
+        stay, hit = self.expected_values(player_total, soft, upcard)
+        return "Advice: {} (EV if you hit {:+.3f}, if you stay {:+.3f}).".format(
+            "hit" if hit > stay else "stay", hit, stay)
+
+    def to_bytes(self):
+        """:return: STRATEGY_MAGIC followed by the EVs as little-endian doubles"""
+        evs = array('d', self.evs)
+        if sys.byteorder != 'little':
+            evs.byteswap()
+        return STRATEGY_MAGIC + evs.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuilds a table written by to_bytes.
+
+        :param data: bytes of a table
+        :return: StrategyTable
+        """
+        evs = array('d')
+        if data[:len(STRATEGY_MAGIC)] != STRATEGY_MAGIC:
+            raise ValueError("not a strategy table")
+        evs.frombytes(data[len(STRATEGY_MAGIC):])
+        if sys.byteorder != 'little':
+            evs.byteswap()
+        if len(evs) != 2 * len(STRATEGY_ROWS) * len(STRATEGY_UPCARDS):
+            raise ValueError("strategy table has the wrong size")
+        return cls(evs)
+
+
+def strategy_path(directory=STRATEGY_DIRECTORY):
+    """:return: path of the cached strategy table for the current rules"""
+    return os.path.join(directory, "blackjack_strategy_{}.bin".format(strategy_key()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_strategy(directory=STRATEGY_DIRECTORY):
+    """Returns the strategy table for the current rules. The table is loaded
+    on first use from its cache file in directory, or computed and saved
+    there when the file is missing or unreadable. Failing to save the
+    table is not an error.
+
+    :param directory: directory holding cached tables
+    :return: StrategyTable
+    """
+    path = strategy_path(directory)
+    try:
+        with open(path, 'rb') as strategy_file:
+            return StrategyTable.from_bytes(strategy_file.read())
+    except (OSError, ValueError):
+        pass
+    table = StrategyTable()
+    # a unique temporary file, so processes saving the same table at once do not collide
+    strategy_file = None
+    try:
+        with tempfile.NamedTemporaryFile('wb', dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                         delete=False) as strategy_file:
+            strategy_file.write(table.to_bytes())
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(strategy_file.name, 0o666 & ~umask)
+        os.replace(strategy_file.name, path)
+    except OSError:
+        if strategy_file is not None:
+            try:
+                os.unlink(strategy_file.name)
+            except OSError:
+                pass
+    return table
+
+
+class StrategyPolicy:
+    """Player policy following the strategy table. The player does not see
+    the dealer's cards before deciding, so the unseen-upcard column is used."""
+
+    def __call__(self, player_total, soft):
+        return get_strategy().should_hit(player_total, soft)
+
+
+def play_hand(shoe, policy):
+    """Plays one hand without any input or output under the rules of
+    play_blackjack, with the player's decisions taken from policy.
+
+    :param shoe: Shoe (or InfiniteShoe) to deal from
+    :param policy: callable taking the player's total and soft flag and returning True to hit
+    :return: (player_total, dealer_total, result) where result is WIN or LOSE
+    """
+    draw = shoe.draw
+    hand = Hand()
+    hand.add_value(RANK_VALUES[draw()])
+    player_total = hand.add_value(RANK_VALUES[draw()])
+    while player_total < BLACKJACK and policy(player_total, hand.soft):
+        player_total = hand.add_value(RANK_VALUES[draw()])
+    if player_total > BLACKJACK:
+        return player_total, DEALER_THRESHOLD, LOSE
+
+    hand = Hand()
+    hand.add_value(RANK_VALUES[draw()])
+    dealer_total = hand.add_value(RANK_VALUES[draw()])
+    while dealer_total <= DEALER_THRESHOLD:
+        dealer_total = hand.add_value(RANK_VALUES[draw()])
+    return player_total, dealer_total, hand_result(player_total, dealer_total)
+
+
+class HandTable:
+    """A policy and the hand arithmetic tabulated for playing hands from a
+    buffer of card values, so a hand is played by table lookups alone.
+    Hand states are numbered total * 2 + soft; next_state[state * 16 + value]
+    is the state after adding a card of value, and hits[state] and
+    dealer_hits[state] tell whether the player (following the policy) and
+    the dealer draw another card. A policy only ever sees a hand's total
+    and softness, so tabulating it once does not change any decision.
+    """
+
+    def __init__(self, policy):
+        """
+        :param policy: callable taking the player's total and soft flag and returning True to hit
+        """
+        num_states = (BLACKJACK + SOFT_ACE_BONUS + 1) * 2
+        self.next_state = bytearray(num_states * 16)
+        hits = bytearray(num_states)
+        dealer_hits = bytearray(num_states)
+        for total in range(BLACKJACK + 1):
+            for soft in (False, True):
+                state = total * 2 + soft
+                for value in CARD_VALUES:
+                    next_total, next_soft = _add_card_value(total, soft, value)
+                    self.next_state[state * 16 + value] = next_total * 2 + next_soft
+                # two cards make a hard total of at least 4 (2 and 2) or a soft one of at least 12
+                reachable = total >= (SOFT_ACE_BONUS + 2 if soft else 4)
+                hits[state] = reachable and total < BLACKJACK and bool(policy(total, soft))
+                dealer_hits[state] = total <= DEALER_THRESHOLD
+        self.hits = bytes(hits)
+        self.dealer_hits = bytes(dealer_hits)
+
+    def play(self, values, index):
+        """Plays one hand under the rules of play_hand with the cards dealt
+        in order from values, starting at index.
+
+        :param values: buffer of card values (1 for an ace)
+        :param index: position in values of the hand's first card
+        :return: (index after the hand's last card, player_total, dealer_total);
+            raises IndexError when values runs out during the hand
+        """
+        next_state = self.next_state
+        hits = self.hits
+        state = next_state[values[index]]
+        state = next_state[state << 4 | values[index + 1]]
+        index += 2
+        while hits[state]:
+            state = next_state[state << 4 | values[index]]
+            index += 1
+        player_total = state >> 1
+        if player_total > BLACKJACK:
+            return index, player_total, DEALER_THRESHOLD
+
+        dealer_hits = self.dealer_hits
+        state = next_state[values[index]]
+        state = next_state[state << 4 | values[index + 1]]
+        index += 2
+        while dealer_hits[state]:
+            state = next_state[state << 4 | values[index]]
+            index += 1
+        return index, player_total, state >> 1
+
+
+def _iter_hand_results(shoe, table, num_hands):
+    """Plays num_hands hands from shoe in bulk: the rest of the shoe up to
+    its end is drawn at once with draw_many and turned into card values
+    with one bytes.translate, and hands are played from that buffer with
+    table until the cut card is passed, when the shoe is reshuffled as
+    shuffle_if_needed would between hands. A hand that outlasts the shoe
+    is finished from a reshuffled shoe, as draw does.
+
+    :param shoe: Shoe, CountedShoe or InfiniteShoe to deal from
+    :param table: HandTable of the player's policy
+    :param num_hands: number of hands to play
+    :return: generator of (cards dealt from the shoe before the hand, running count before the hand
+        (0 unless shoe is a CountedShoe), result) per hand
+    """
+    infinite = isinstance(shoe, InfiniteShoe)
+    tags = getattr(shoe, 'tags', None)
+    if tags is not None:
+        tag_offset = -min(tags)
+        tag_table = bytes(tag + tag_offset for tag in tags) + bytes(256 - len(tags))
+    play = table.play
+    hands_left = num_hands
+    while hands_left:
+        if infinite:
+            first = 0
+            ranks = shoe.draw_many(INFINITE_BLOCK)
+            limit = INFINITE_BLOCK
+        else:
+            shoe.shuffle_if_needed()
+            first = shoe.position
+            running_count = getattr(shoe, 'running_count', 0)
+            ranks = shoe.draw_many(shoe.size - first)
+            limit = shoe.cut_card - first
+        values = ranks.translate(RANK_VALUE_TABLE)
+        if tags is not None:
+            shifted_tags = ranks.translate(tag_table)
+        else:
+            running_count = 0
+
+        index = 0
+        while hands_left and index < limit:
+            start = index
+            extended = False
+            while True:
+                try:
+                    index, player_total, dealer_total = play(values, start)
+                    break
+                except IndexError:
+                    extra = shoe.draw_many(1)
+                    ranks += extra
+                    values += extra.translate(RANK_VALUE_TABLE)
+                    extended = True
+            hands_left -= 1
+            yield first + start, running_count, hand_result(player_total, dealer_total)
+            if extended:
+                # the shoe was reshuffled during the hand and has moved on
+                break
+            if tags is not None:
+                running_count += sum(shifted_tags[start:index]) - tag_offset * (index - start)
+
+
+class HandStats:
+    """Running totals of simulated hands, from which rates and the expected
+    value per hand (in units bet) follow together with confidence intervals.
+    Only sums are kept, so memory does not grow with the number of hands."""
+
+    def __init__(self):
+        self.hands = 0
+        self.wins = 0
+        self.losses = 0
+        self.total = 0
+        self.total_squares = 0
+
+    def add(self, result):
+        """Records the result of one hand.
+
+        :param result: units won by the player, WIN or LOSE
+        :return: None
+        """
+        self.hands += 1
+        if result > 0:
+            self.wins += 1
+        elif result < 0:
+            self.losses += 1
+        self.total += result
+        self.total_squares += result * result
+
+    def merge(self, other):
+        """Adds the results held by other into these statistics.
+
+        :param other: HandStats from another batch of hands
+        :return: None
+        """
+        self.hands += other.hands
+        self.wins += other.wins
+        self.losses += other.losses
+        self.total += other.total
+        self.total_squares += other.total_squares
+
+    def win_rate(self):
+        """Fraction of hands won, 0.0 when no hands were played."""
+        return self.wins / self.hands if self.hands else 0.0
+
+    def loss_rate(self):
+        """Fraction of hands lost, 0.0 when no hands were played."""
+        return self.losses / self.hands if self.hands else 0.0
+
+    def push_rate(self):
+        """Fraction of hands neither won nor lost, 0.0 when no hands were played."""
+        return (self.hands - self.wins - self.losses) / self.hands if self.hands else 0.0
+
+    def expected_value(self):
+        """Mean units won per hand, 0.0 when no hands were played."""
+        return self.total / self.hands if self.hands else 0.0
+
+    def standard_error(self):
+        """Standard error of expected_value, None for fewer than two hands."""
+        if self.hands < 2:
+            return None
+        mean = self.total / self.hands
+        variance = (self.total_squares - self.hands * mean * mean) / (self.hands - 1)
+        return math.sqrt(max(variance, 0.0) / self.hands)
+
+    def confidence_interval(self, z=1.96):
+        """Normal-approximation confidence interval of expected_value.
+
+        :param z: standard normal quantile, 1.96 for 95%
+        :return: (low, high) tuple, None for fewer than two hands
+        """
+        error = self.standard_error()
+        if error is None:
+            return None
+        return self.expected_value() - z * error, self.expected_value() + z * error
+
+    def summary(self):
+        """Returns a one-line text report of the statistics."""
+        line = "Hands: {}  win {:.3%}  lose {:.3%}  push {:.3%}  EV {:+.5f}".format(
+            self.hands, self.win_rate(), self.loss_rate(), self.push_rate(), self.expected_value())
+        interval = self.confidence_interval()
+        if interval is not None:
+            line += " (95% CI {:+.5f} to {:+.5f})".format(*interval)
+        return line
+
+
+def simulate_hand_batch(num_hands, policy, seed=None, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION):
+    """Plays num_hands hands in the current process from a fresh shoe with
+    its own random stream, drawing the cards a shoe at a time (see
+    _iter_hand_results).
+
+    :param num_hands: number of hands to play
+    :param policy: callable taking the player's total and soft flag and returning True to hit
+    :param seed: seed of the batch's random stream
+    :param num_decks: decks in the shoe, None for an infinite deck
+    :param penetration: fraction of the shoe dealt before reshuffling
+    :return: HandStats for the batch
+    """
+    rng = random.Random(seed)
+    shoe = InfiniteShoe(rng) if num_decks is None else Shoe(num_decks, penetration, rng)
+    stats = HandStats()
+    for _, _, result in _iter_hand_results(shoe, HandTable(policy), num_hands):
+        stats.add(result)
+    return stats
+
+
+def _simulate_hand_batch_task(args):
+    """Unpacks a batch description for simulate_hand_batch in a worker process."""
+    return simulate_hand_batch(*args)
+
+
+def iter_simulation(num_hands, policy=None, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION,
+                    processes=None, batch_size=100000, seed=None):
+    """Plays num_hands headless hands split into batches that are spread
+    across a pool of worker processes, yielding the running totals as every
+    batch completes. Stopping the iteration early stops the workers.
+
+    Every batch gets its own seed derived from seed, so a run with a given
+    seed and batch_size gives the same final results for any number of
+    processes. The policy must be picklable (a module level class or
+    function).
+
+    :param num_hands: total number of hands to play
+    :param policy: callable taking the player's total and soft flag and returning True to hit,
+        StandOnPolicy() when None
+    :param num_decks: decks in each shoe, None for an infinite deck
+    :param penetration: fraction of the shoe dealt before reshuffling
+    :param processes: number of worker processes, None for one per CPU, 1 to stay in-process
+    :param batch_size: number of hands handed to a worker at a time
+    :param seed: base seed for the batches, None for a random one
+    :return: generator of the same HandStats, updated after each batch
+    """
+    if policy is None:
+        policy = StandOnPolicy()
+    seeds = random.Random(seed)
+    batches = []
+    for start in range(0, num_hands, batch_size):
+        batches.append((min(batch_size, num_hands - start), policy, seeds.getrandbits(64), num_decks, penetration))
+
+    return _iter_batches(_simulate_hand_batch_task, batches, HandStats(), processes)
+
+
+def _iter_batches(task, batches, stats, processes):
+    """Runs task on every batch, in this process or in a pool of worker
+    processes, merging each batch's statistics into stats as it completes.
+
+    :param task: module level function taking a batch and returning statistics
+    :param batches: batch descriptions
+    :param stats: statistics object with a merge method, updated in place
+    :param processes: number of worker processes, None for one per CPU, 1 to stay in-process
+    :return: generator yielding stats after each batch
+    """
+    if processes == 1:
+        for batch in batches:
+            stats.merge(task(batch))
+            yield stats
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for batch_stats in pool.imap_unordered(task, batches):
+                stats.merge(batch_stats)
+                yield stats
+
+
+def simulate_hands(num_hands, policy=None, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION,
+                   processes=None, batch_size=100000, seed=None):
+    """Plays num_hands headless hands like iter_simulation and returns the
+    final statistics.
+
+    :return: HandStats for all hands
+    """
+    stats = HandStats()
+    for stats in iter_simulation(num_hands, policy, num_decks, penetration, processes, batch_size, seed):
+        pass
+    return stats
+
+
+class CountedShoe(Shoe):
+    """Shoe that keeps a running count of the cards dealt since the last
+    shuffle. Every rank has a tag, the running count being the sum of the
+    tags of the cards dealt, and the true count the running count per deck
+    left in the shoe."""
+
+    def __init__(self, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION, rng=None, tags=HI_LO_TAGS):
+        """
+        :param tags: count added per rank index of CARD_LABELS, see count_tags
+        """
+        self.tags = count_tags(tags)
+        self.running_count = 0
+        super().__init__(num_decks, penetration, rng)
+
+    def shuffle(self):
+        """Returns all cards to the shoe, shuffles it and resets the count.
+
+        :return: None
+        """
+        super().shuffle()
+        self.running_count = 0
+
+    def draw(self):
+        """Removes a random card from the shoe and counts it.
+
+        :return: the rank index of the card in CARD_LABELS
+        """
+        rank = super().draw()
+        self.running_count += self.tags[rank]
+        return rank
+
+    def draw_many(self, num_cards):
+        """Removes num_cards random cards from the shoe and counts the ones
+        dealt since the last shuffle.
+
+        :return: bytearray of rank indices in CARD_LABELS, in the order drawn
+        """
+        shuffles = self.shuffles
+        drawn = super().draw_many(num_cards)
+        counted = drawn if self.shuffles == shuffles else drawn[len(drawn) - self.position:]
+        tags = self.tags
+        self.running_count += sum(tags[rank] for rank in counted)
+        return drawn
+
+    def true_count(self):
+        """:return: running count per deck left in the shoe, 0.0 for an empty shoe"""
+        remaining = self.size - self.position
+        if not remaining:
+            return 0.0
+        return self.running_count * CARDS_PER_RANK * len(CARD_LABELS) / remaining
+
+
+def count_tags(tags):
+    """Normalizes a counting system's tag table.
+
+    :param tags: sequence of tags per rank index of CARD_LABELS, or dict of
+        card labels mapped to tags (missing labels count 0)
+    :return: tuple of int tags per rank index
+    """
+    if isinstance(tags, dict):
+        unknown = set(tags) - set(CARD_LABELS)
+        if unknown:
+            raise ValueError("unknown card labels: {}".format(', '.join(sorted(unknown))))
+        return tuple(int(tags.get(card_label, 0)) for card_label in CARD_LABELS)
+    tags = tuple(int(tag) for tag in tags)
+    if len(tags) != len(CARD_LABELS):
+        raise ValueError("a tag table needs one tag per card label")
+    return tags
+
+
+class CountStats:
+    """HandStats of simulated hands grouped by the true count when each
+    hand started. True counts are floored and clamped to [-limit, limit],
+    so memory stays bounded however many hands are added."""
+
+    def __init__(self, limit=TRUE_COUNT_LIMIT):
+        self.limit = limit
+        self.buckets = {}
+
+    def add(self, true_count, result):
+        """Records the result of a hand that started at true_count.
+
+        :param true_count: true count at the start of the hand
+        :param result: units won by the player
+        :return: None
+        """
+        bucket = max(-self.limit, min(self.limit, math.floor(true_count)))
+        stats = self.buckets.get(bucket)
+        if stats is None:
+            stats = self.buckets[bucket] = HandStats()
+        stats.add(result)
+
+    def merge(self, other):
+        """Adds the results held by other into these statistics.
+
+        :param other: CountStats from another batch of hands
+        :return: None
+        """
+        for bucket, other_stats in other.buckets.items():
+            stats = self.buckets.get(bucket)
+            if stats is None:
+                stats = self.buckets[bucket] = HandStats()
+            stats.merge(other_stats)
+
+    @property
+    def hands(self):
+        """Number of hands recorded."""
+        return sum(stats.hands for stats in self.buckets.values())
+
+    def summary(self):
+        """Returns a text report with one line per true count."""
+        lines = ["Hands: {}".format(self.hands)]
+        for bucket in sorted(self.buckets):
+            stats = self.buckets[bucket]
+            label = "{:+d}".format(bucket)
+            if abs(bucket) == self.limit:
+                label += " or more" if bucket > 0 else " or less"
+            line = "True count {:<10} hands {:>10}  EV {:+.5f}".format(label, stats.hands, stats.expected_value())
+            interval = stats.confidence_interval()
+            if interval is not None:
+                line += " (95% CI {:+.5f} to {:+.5f})".format(*interval)
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def simulate_count_batch(num_hands, policy, seed=None, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION,
+                         tags=HI_LO_TAGS, limit=TRUE_COUNT_LIMIT):
+    """Plays num_hands hands in the current process from a fresh counted
+    shoe, recording every result against the true count at the start of
+    its hand.
+
+    :param num_hands: number of hands to play
+    :param policy: callable taking the player's total and soft flag and returning True to hit
+    :param seed: seed of the batch's random stream
+    :param num_decks: decks in the shoe
+    :param penetration: fraction of the shoe dealt before reshuffling
+    :param tags: counting system's tag table, see count_tags
+    :param limit: largest true count tracked separately
+    :return: CountStats for the batch
+    """
+    shoe = CountedShoe(num_decks, penetration, random.Random(seed), tags)
+    stats = CountStats(limit)
+    cards_per_deck = CARDS_PER_RANK * len(CARD_LABELS)
+    for position, running_count, result in _iter_hand_results(shoe, HandTable(policy), num_hands):
+        stats.add(running_count * cards_per_deck / (shoe.size - position), result)
+    return stats
+
+
+def _simulate_count_batch_task(args):
+    """Unpacks a batch description for simulate_count_batch in a worker process."""
+    return simulate_count_batch(*args)
+
+
+def iter_count_simulation(num_hands, policy=None, num_decks=DEFAULT_DECKS, penetration=DEFAULT_PENETRATION,
+                          tags=HI_LO_TAGS, limit=TRUE_COUNT_LIMIT, processes=None, batch_size=100000, seed=None):
+    """Plays num_hands headless hands like iter_simulation while counting
+    cards, yielding the EV-by-true-count statistics as every batch
+    completes.
+
+    :param tags: counting system's tag table, see count_tags
+    :param limit: largest true count tracked separately
+    :return: generator of the same CountStats, updated after each batch
+    """
+    if policy is None:
+        policy = StandOnPolicy()
+    tags = count_tags(tags)
+    seeds = random.Random(seed)
+    batches = []
+    for start in range(0, num_hands, batch_size):
+        batches.append((min(batch_size, num_hands - start), policy, seeds.getrandbits(64), num_decks, penetration,
+                        tags, limit))
+    return _iter_batches(_simulate_count_batch_task, batches, CountStats(limit), processes)
+
+
 def main():
     """Runs a program for playing Blackjack with one player
-    and a dealer
+    and a dealer, or with the arguments "simulate N" plays N headless
+    hands, printing the running totals as batches complete (Ctrl-C stops
+    the run early), or with "count N" plays N hands counting cards with
+    Hi-Lo and prints EV by true count
     """
 
+    if len(sys.argv) == 3 and sys.argv[1] == "count":
+        stats = CountStats()
+        try:
+            for stats in iter_count_simulation(int(sys.argv[2]), StrategyPolicy()):
+                pass
+        except KeyboardInterrupt:
+            pass
+        print(stats.summary())
+        return
+
+    if len(sys.argv) == 3 and sys.argv[1] == "simulate":
+        stats = HandStats()
+        try:
+            for stats in iter_simulation(int(sys.argv[2])):
+                print(stats.summary())
+        except KeyboardInterrupt:
+            print("Stopped after {} hands.".format(stats.hands))
+        return
+
     # call play_blackjack() here and remove pass below
     play_blackjack()
 
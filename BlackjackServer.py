@@ -0,0 +1,399 @@
+# Blackjack
+# Asyncio server running many Blackjack tables with several players each
+
+import asyncio
+import sys
+import time
+
+from Blackjack import (BLACKJACK, DEALER_THRESHOLD, DEFAULT_DECKS, DEFAULT_PENETRATION, Hand, Shoe, StandOnPolicy,
+                       WIN, deal_card, get_strategy, hand_result)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8021
+SEATS_PER_TABLE = 5
+ACTION_TIMEOUT = 30.0
+ACTION_PROMPT = "Hit (h) or Stay (s)?"
+AGAIN_PROMPT = "Play again (Y/N)?"
+
+
+class Seat:
+    """A player's connection to a table."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.connected = True
+        self.left = asyncio.Event()
+
+    async def send(self, lines):
+        """Writes lines to the player, dropping the player when the
+        connection fails.
+
+        :param lines: strings to send, one per line
+        :return: None
+        """
+        if not self.connected:
+            return
+        try:
+            self.writer.write(('\n'.join(lines) + '\n').encode())
+            await self.writer.drain()
+        except ConnectionError:
+            self.connected = False
+
+    async def ask(self, prompt, answers, deadline):
+        """Sends prompt until the player gives one of answers. Invalid
+        answers do not buy more time: every re-prompt only waits for what
+        is left until deadline.
+
+        :param prompt: question to send
+        :param answers: accepted answers
+        :param deadline: event loop time by which the player has to answer
+        :return: the answer, None when the player timed out or disconnected
+        """
+        loop = asyncio.get_running_loop()
+        while self.connected:
+            await self.send([prompt])
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                await self.send(["Time is up."])
+                return None
+            except (ConnectionError, ValueError):
+                line = b''
+            if not line:
+                self.connected = False
+                return None
+            answer = line.decode(errors='replace').strip()
+            if answer in answers:
+                return answer
+        return None
+
+    async def close(self, message=None):
+        """Says goodbye to the player and closes the connection.
+
+        :return: None
+        """
+        if message is not None:
+            await self.send([message])
+        self.connected = False
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.left.set()
+
+
+class Table:
+    """One dealer with its own shoe and up to seats players. The table runs
+    as its own task, playing a round whenever someone is seated: every
+    player is dealt two cards and plays in seat order, then the dealer
+    plays as in deal_cards_to_dealer and every hand is scored with
+    hand_result. Players joining during a round are seated for the next.
+    Every action of a player, however many prompts it takes, is bounded
+    by action_timeout; a player who does not answer in time stays, or
+    leaves when asked to play again.
+    """
+
+    def __init__(self, number, seats=SEATS_PER_TABLE, action_timeout=ACTION_TIMEOUT, num_decks=DEFAULT_DECKS,
+                 penetration=DEFAULT_PENETRATION):
+        self.number = number
+        self.seats = seats
+        self.action_timeout = action_timeout
+        self.shoe = Shoe(num_decks, penetration)
+        self.seated = []
+        self.waiting = []
+        self.joined = asyncio.Event()
+        self.rounds = 0
+        self.hands = 0
+
+    def has_room(self):
+        """:return: True when another player can join the table"""
+        return len(self.seated) + len(self.waiting) < self.seats
+
+    def join(self, seat):
+        """Adds a player to the table for the next round.
+
+        :param seat: Seat of the joining player
+        :return: None
+        """
+        self.waiting.append(seat)
+        self.joined.set()
+
+    async def run(self):
+        """Plays rounds for as long as the task runs.
+
+        :return: None
+        """
+        while True:
+            self.seated.extend(self.waiting)
+            self.waiting = []
+            if not self.seated:
+                self.joined.clear()
+                await self.joined.wait()
+                continue
+            await self.play_round()
+
+    async def _play_player(self, seat):
+        """Deals to one player and takes hit/stay decisions until the player
+        stays, reaches BLACKJACK or busts.
+
+        :return: the player's final total
+        """
+        player_label_1 = deal_card(self.shoe)
+        player_label_2 = deal_card(self.shoe)
+        hand = Hand(player_label_1, player_label_2)
+        await seat.send(["Player drew {} and {}.".format(player_label_1, player_label_2),
+                         "Player's total is {}.".format(hand.total), ""])
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while hand.total < BLACKJACK:
+            # asking for advice is part of the same action and keeps its deadline
+            if deadline is None:
+                deadline = loop.time() + self.action_timeout
+            answer = await seat.ask(ACTION_PROMPT, ("h", "s", "?"), deadline)
+            if answer == "?":
+                await seat.send([get_strategy().advice(hand.total, hand.soft), ""])
+                continue
+            deadline = None
+            if answer != "h":
+                break
+            player_extra_label = deal_card(self.shoe)
+            hand.add(player_extra_label)
+            await seat.send(["Player drew {}.".format(player_extra_label),
+                             "Player's total is {}.".format(hand.total), ""])
+        return hand.total
+
+    async def _play_dealer(self, seats):
+        """Plays the dealer's hand, showing every card to seats.
+
+        :return: the dealer's final total
+        """
+        dealer_label_1 = deal_card(self.shoe)
+        dealer_label_2 = deal_card(self.shoe)
+        hand = Hand(dealer_label_1, dealer_label_2)
+        lines = ["The dealer has {} and {}.".format(dealer_label_1, dealer_label_2),
+                 "Dealer's total is {}.".format(hand.total), ""]
+        while hand.total <= DEALER_THRESHOLD:
+            dealer_extra_label = deal_card(self.shoe)
+            hand.add(dealer_extra_label)
+            lines.extend(["Dealer drew {}.".format(dealer_extra_label),
+                          "Dealer's total is {}.".format(hand.total), ""])
+        await asyncio.gather(*(seat.send(lines) for seat in seats))
+        return hand.total
+
+    async def _ask_again(self, seat):
+        """Asks a player whether to stay at the table.
+
+        :return: True when the player plays another round
+        """
+        deadline = asyncio.get_running_loop().time() + self.action_timeout
+        answer = await seat.ask(AGAIN_PROMPT, ("Y", "y", "N", "n"), deadline)
+        if answer in ("Y", "y"):
+            return True
+        await seat.close("Goodbye.")
+        return False
+
+    async def play_round(self):
+        """Plays one round with every seated player.
+
+        :return: None
+        """
+        if self.shoe.shuffle_if_needed():
+            await asyncio.gather(*(seat.send(["Shuffling the shoe.", ""]) for seat in self.seated))
+        totals = []
+        for seat in self.seated:
+            totals.append(await self._play_player(seat))
+
+        dealer_total = DEALER_THRESHOLD
+        if any(total <= BLACKJACK for total in totals):
+            dealer_total = await self._play_dealer(self.seated)
+
+        for seat, player_total in zip(self.seated, totals):
+            # as in play_blackjack, a bust player is scored against DEALER_THRESHOLD
+            result = hand_result(player_total, dealer_total if player_total <= BLACKJACK else DEALER_THRESHOLD)
+            await seat.send(["YOU WIN!" if result == WIN else "YOU LOSE!", ""])
+        self.rounds += 1
+        self.hands += len(self.seated)
+
+        staying = await asyncio.gather(*(self._ask_again(seat) for seat in self.seated))
+        self.seated = [seat for seat, stays in zip(self.seated, staying) if stays]
+
+
+class BlackjackServer:
+    """Seats every connection at the first table with a free seat, opening
+    a new table when all are full. Tables run as separate tasks on one event
+    loop, so a slow player only ever holds up their own table."""
+
+    def __init__(self, seats=SEATS_PER_TABLE, action_timeout=ACTION_TIMEOUT, num_decks=DEFAULT_DECKS,
+                 penetration=DEFAULT_PENETRATION):
+        self.seats = seats
+        self.action_timeout = action_timeout
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.tables = []
+        self.tasks = []
+        self.server = None
+
+    def _table_with_room(self):
+        """:return: a Table with a free seat, opened when needed"""
+        for table in self.tables:
+            if table.has_room():
+                return table
+        table = Table(len(self.tables) + 1, self.seats, self.action_timeout, self.num_decks, self.penetration)
+        self.tables.append(table)
+        self.tasks.append(asyncio.create_task(table.run()))
+        return table
+
+    async def handle(self, reader, writer):
+        """Seats a new connection and waits until the player leaves.
+
+        :return: None
+        """
+        table = self._table_with_room()
+        seat = Seat(reader, writer)
+        await seat.send(["Let's Play Blackjack!", "You are at table {}.".format(table.number), ""])
+        table.join(seat)
+        await seat.left.wait()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, backlog=4096):
+        """Starts listening for players.
+
+        :param host: interface to listen on
+        :param port: TCP port, 0 to pick a free one
+        :param backlog: listen queue length
+        :return: the asyncio Server
+        """
+        self.server = await asyncio.start_server(self.handle, host, port, backlog=backlog)
+        return self.server
+
+    async def close(self):
+        """Stops listening and stops every table.
+
+        :return: None
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    @property
+    def hands(self):
+        """Number of player hands played on all tables."""
+        return sum(table.hands for table in self.tables)
+
+
+class Client:
+    """Scripted Blackjack player for testing the server. Decisions come from
+    a policy as in Blackjack.play_hand; the client only learns its total
+    from the server's messages, so the policy is told the hand is hard."""
+
+    def __init__(self, policy=None, hands=1):
+        self.policy = policy if policy is not None else StandOnPolicy()
+        self.hands = hands
+        self.hands_played = 0
+        self.wins = 0
+        self.losses = 0
+
+    async def run(self, host, port):
+        """Connects to the server and plays self.hands hands.
+
+        :return: self
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        total = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                text = line.decode().strip()
+                if text.startswith("Player's total is "):
+                    total = int(text[len("Player's total is "):-1])
+                elif text == ACTION_PROMPT:
+                    writer.write(b"h\n" if self.policy(total, False) else b"s\n")
+                elif text == "YOU WIN!":
+                    self.wins += 1
+                elif text == "YOU LOSE!":
+                    self.losses += 1
+                elif text == AGAIN_PROMPT:
+                    self.hands_played += 1
+                    writer.write(b"Y\n" if self.hands_played < self.hands else b"N\n")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+        return self
+
+
+async def load_test(num_clients, hands=10, seats=SEATS_PER_TABLE, action_timeout=ACTION_TIMEOUT, host=DEFAULT_HOST,
+                    port=0, policy=None):
+    """Starts a server in this process and has num_clients scripted players
+    play hands hands each against it at the same time.
+
+    :param num_clients: number of concurrent players
+    :param hands: hands played by each player
+    :param seats: players per table
+    :param action_timeout: seconds a player has to answer
+    :param port: server port, 0 to pick a free one
+    :param policy: player policy, StandOnPolicy() when None
+    :return: dict with clients, tables, hands, wins, seconds and hands_per_second
+    """
+    blackjack_server = BlackjackServer(seats, action_timeout)
+    server = await blackjack_server.start(host, port)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        start = time.perf_counter()
+        clients = await asyncio.gather(*(Client(policy, hands).run(host, port) for _ in range(num_clients)))
+        seconds = time.perf_counter() - start
+    finally:
+        await blackjack_server.close()
+    played = sum(client.wins + client.losses for client in clients)
+    return {
+        "clients": num_clients,
+        "tables": len(blackjack_server.tables),
+        "hands": played,
+        "wins": sum(client.wins for client in clients),
+        "seconds": seconds,
+        "hands_per_second": played / seconds if seconds else 0.0,
+    }
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Runs the Blackjack server until cancelled.
+
+    :return: None
+    """
+    blackjack_server = BlackjackServer()
+    server = await blackjack_server.start(host, port)
+    print("Serving Blackjack on {}".format(
+        ', '.join('{}:{}'.format(*sock.getsockname()[:2]) for sock in server.sockets)))
+    try:
+        await server.serve_forever()
+    finally:
+        await blackjack_server.close()
+
+
+def main():
+    """Serves Blackjack on DEFAULT_PORT (or the port given as the only
+    argument), or with the arguments "loadtest N" has N scripted players
+    play against an in-process server and prints the results."""
+
+    if len(sys.argv) == 3 and sys.argv[1] == "loadtest":
+        results = asyncio.run(load_test(int(sys.argv[2])))
+        for key, value in results.items():
+            print("{}: {}".format(key, round(value, 2) if isinstance(value, float) else value))
+    else:
+        port = int(sys.argv[1]) if len(sys.argv) == 2 else DEFAULT_PORT
+        try:
+            asyncio.run(serve(port=port))
+        except KeyboardInterrupt:
+            print("Goodbye.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,62 @@
 
 
 ####### DO NOT EDIT CODE BELOW (changing MAX_MISSES is ok) ########
+import bz2
+import contextlib
+import gzip
+import heapq
+import itertools
+import math
+import mmap
+import multiprocessing
+import os
 import random
+import shutil
+import struct
 import sys
+import tempfile
+from array import array
+from collections import Counter
 
 MAX_MISSES = 5
 BORDER_LENGTH = 30
 SINGLE_CHAR_LENGTH = 1
+INDEX_CHUNK_SIZE = 1 << 24
+CORPUS_SUFFIX = ".corpus"
+CORPUS_MAGIC = b"GGC1"
+# magic, source size, source mtime in ns, number of words, number of buckets
+CORPUS_HEADER = struct.Struct("<4sQQQI")
+# word length, distinct letters, index of the bucket's first word, number of words
+CORPUS_BUCKET = struct.Struct("<HHQQ")
+# distinct words held in memory while building a corpus before they are
+# sorted and spilled to a run file, and run files merged at a time
+BUILD_RUN_WORDS = 1 << 21
+BUILD_MERGE_WIDTH = 64
+# run file lines start with the word's length and distinct letters in fixed
+# width hex, so plain string order is corpus order
+RUN_KEY_WIDTH = 8
+DIFFICULTY_SUFFIX = ".difficulty"
+DIFFICULTY_MAGIC = b"GGD1"
+# magic, source size, source mtime in ns, number of words, MAX_MISSES, length of the letter order
+DIFFICULTY_HEADER = struct.Struct("<4sQQQBH")
+UNRATED = 0xFF
+# inclusive ranges of ratings (misses needed, MAX_MISSES + 1 when unsolved) per tier
+DIFFICULTY_TIERS = {
+    "easy": (0, 1),
+    "medium": (2, 3),
+    "hard": (4, MAX_MISSES + 1),
+}
+TIER_SAMPLE_TRIES = 64
+STDIN_SOURCE = "-"
+# openers of compressed words files by file name extension
+COMPRESSED_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+}
+# words sampled for a session read from stdin, which can only be read once
+STDIN_SAMPLE_SIZE = 1000
+# guessing order used when no dictionary word fits the revealed letters
+FALLBACK_LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
 
 
 def blank_chars(word):
@@ -69,16 +119,9 @@ def check_guess(word, guess):
     :param guess: a single character guessed by user
     :return positions: list of integer positions
     """
-    positions = []
-    start = 0
-    if guess in word and len(guess) == SINGLE_CHAR_LENGTH:
-        num_guess = word.count(guess)
-        for i in range(num_guess):
-            guess_index = word.find(guess, start, len(word))
-            positions.append(guess_index)
-            start = guess_index + SINGLE_CHAR_LENGTH
-
-    return positions
+    if len(guess) != SINGLE_CHAR_LENGTH:
+        return []
+    return [position for position, char in enumerate(word) if char == guess]
 
 
 def update_chars(chars, guess, positions):
@@ -124,7 +167,7 @@ def update_state(chars, misses, guess, positions):
         add_to_misses(misses, guess)
 
 
-def is_round_complete(chars, misses):
+def is_round_complete(chars, misses, blanks=None):
     """Indicates whether or not a round has ended. This function returns True
     when the user has successfully guessed the target word or exceeds the
     number of allowed misses. Otherwise, the function returns False,
@@ -135,11 +178,12 @@ def is_round_complete(chars, misses):
 
     :param chars: a list of characters
     :param misses: list of guesses not present in target word
+    :param blanks: number of unrevealed characters when known (see Round),
+        found by looking through chars when None
     :return status: True when round is finished, False otherwise
     """
 
-    chars_string = "".join(chars)
-    if "_" not in chars_string:
+    if blanks == 0 or (blanks is None and "_" not in chars):
         print("\nYOU GOT IT!")
         return True
     elif len(misses) > MAX_MISSES:
@@ -149,6 +193,70 @@ def is_round_complete(chars, misses):
         return False
 
 
+class Round:
+    """State of one round for a target word. The positions of every letter
+    of the word are looked up once, when the round starts, and the round
+    counts the characters still unrevealed, so resolving a guess and
+    checking for completion never scan the word or chars again.
+    """
+
+    __slots__ = ('word', 'positions', 'chars', 'misses', 'blanks')
+
+    def __init__(self, word):
+        """
+        :param word: target word as a string
+        """
+        self.word = word
+        self.positions = {}
+        for position, char in enumerate(word):
+            self.positions.setdefault(char, []).append(position)
+        self.chars = blank_chars(word)
+        self.misses = []
+        self.blanks = len(word)
+
+    def check_guess(self, guess):
+        """Returns the positions where guess is present in the word, like
+        check_guess.
+
+        :param guess: a single character guessed by user
+        :return positions: list of integer positions, not to be modified
+        """
+        return self.positions.get(guess, [])
+
+    def update_state(self, guess, positions):
+        """Records guess like update_state, keeping count of the characters
+        still unrevealed.
+
+        :param guess: a single character guessed by user
+        :param positions: positions of guess from check_guess
+        :return: None
+        """
+        if positions:
+            if self.chars[positions[0]] != guess:
+                self.blanks -= len(positions)
+                update_chars(self.chars, guess, positions)
+        else:
+            add_to_misses(self.misses, guess)
+
+    def guess(self, guess):
+        """Checks guess and records it.
+
+        :param guess: a single character guessed by user
+        :return positions: list of integer positions of guess in the word
+        """
+        positions = self.positions.get(guess, [])
+        self.update_state(guess, positions)
+        return positions
+
+    def is_solved(self):
+        """:return: True when every character of the word is revealed"""
+        return self.blanks == 0
+
+    def is_lost(self):
+        """:return: True when the round has more than MAX_MISSES misses"""
+        return len(self.misses) > MAX_MISSES
+
+
 def read_words(filepath):
     """Opens a file of word located at filepath, reads the file of words line by line,
     and adds each word from the file to a list. The list is returned by the
@@ -166,12 +274,606 @@ def read_words(filepath):
     return words_list
 
 
-def get_word(words):
+class WordIndex:
+    """Read-only sequence of the words in a file of words (one per line),
+    backed by a memory map of the file. Only the offset of the first byte
+    of every non-blank line is kept, in an array of 64-bit integers; a word
+    is decoded from the map when it is looked up. Building the index scans
+    the file once in chunks, so peak memory is the offsets plus one chunk
+    whatever the size of the file.
+    """
+
+    def __init__(self, filepath):
+        """
+        :param filepath: path to input file of words (one per line)
+        """
+        self.filepath = filepath
+        self.file = open(filepath, "rb")
+        if os.fstat(self.file.fileno()).st_size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = b""
+        self.offsets = self._index_lines(self.map)
+
+    @staticmethod
+    def _index_lines(data):
+        """Finds the start offset of every non-blank line of data.
+
+        :param data: bytes-like contents of a words file
+        :return: array('Q') of offsets in file order
+        """
+        offsets = array('Q')
+        size = len(data)
+        start = 0
+        while start < size:
+            end = start + INDEX_CHUNK_SIZE
+            if end >= size:
+                end = size
+            else:
+                # end the chunk after its last newline, or after the first one
+                # past it for a line longer than a whole chunk
+                newline = data.rfind(b"\n", start, end)
+                if newline < 0:
+                    newline = data.find(b"\n", end)
+                end = size if newline < 0 else newline + 1
+            lines = data[start:end].split(b"\n")
+            line_starts = itertools.accumulate(map(len, lines), lambda offset, length: offset + length + 1,
+                                               initial=start)
+            offsets.extend(itertools.compress(line_starts, map(len, map(bytes.strip, lines))))
+            start = end
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        start = self.offsets[index]
+        end = self.map.find(b"\n", start)
+        if end < 0:
+            end = len(self.map)
+        return self.map[start:end].decode("utf-8", "replace").strip()
+
+    def close(self):
+        """Releases the memory map and the file.
+
+        :return: None
+        """
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def normalize_word(line):
+    """Normalizes a line of a words file for the corpus.
+
+    :param line: a line of text
+    :return: the word in lower case, None when the line is not a single word
+        made of letters only (other characters could never be guessed)
+    """
+    word = line.strip().lower()
+    if word.isalpha():
+        return word
+    return None
+
+
+@contextlib.contextmanager
+def _replacing_file(path):
+    """Opens a uniquely named temporary file next to path for writing and
+    moves it over path once the block completes, so readers never see a
+    partial file and concurrent writers of the same path never share a
+    temporary file. The temporary file is removed when the block fails.
+
+    :param path: path of the file to write
+    :return: context manager yielding the binary temporary file
+    """
+    temp_file = tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(path)),
+                                            prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False)
+    try:
+        with temp_file:
+            # temporary files are private; give the result the usual permissions
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_file.fileno(), 0o666 & ~umask)
+            yield temp_file
+        os.replace(temp_file.name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temp_file.name)
+        raise
+
+
+class Corpus:
+    """Compiled, read-only form of a words file. The file's words are
+    normalized and deduplicated, then packed in one contiguous UTF-8 buffer
+    with an array of offsets, sorted by word length, number of distinct
+    letters and the word itself. Each (length, distinct letters) bucket is
+    a range of that order, so picking a random word of a given length or
+    letter count takes no scan of the words.
+
+    The compiled corpus lives next to the source as <source>.corpus and
+    records the source's size and modification time; open rebuilds it
+    whenever those no longer match. Opening a current corpus only reads its
+    header and bucket table and maps the rest of the file.
+    """
+
+    def __init__(self, path):
+        """Opens a compiled corpus; use Corpus.open to also build it.
+
+        :param path: path to the .corpus file
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = CORPUS_HEADER.unpack_from(self.map, 0)
+        if header[0] != CORPUS_MAGIC:
+            self.close()
+            raise ValueError("{} is not a word corpus".format(path))
+        self.source_size, self.source_mtime, num_words, num_buckets = header[1:]
+
+        self.buckets = {}
+        self.by_length = {}
+        self.by_letters = {}
+        position = CORPUS_HEADER.size
+        for _ in range(num_buckets):
+            length, letters, start, count = CORPUS_BUCKET.unpack_from(self.map, position)
+            position += CORPUS_BUCKET.size
+            self.buckets[length, letters] = (start, count)
+            first, total = self.by_length.get(length, (start, 0))
+            self.by_length[length] = (first, total + count)
+            self.by_letters.setdefault(letters, []).append((start, count))
+
+        offsets_size = (num_words + 1) * 8
+        self._view = memoryview(self.map)
+        if sys.byteorder == 'little':
+            self.offsets = self._view[position:position + offsets_size].cast('Q')
+        else:
+            self.offsets = array('Q', self._view[position:position + offsets_size])
+            self.offsets.byteswap()
+        self.data_start = position + offsets_size
+        self._difficulty = None
+
+    @classmethod
+    def open(cls, source, path=None):
+        """Opens the compiled corpus of source, building it first when it is
+        missing or the source changed since it was built.
+
+        :param source: path to the text file of words (one per line)
+        :param path: path of the compiled corpus, <source>.corpus when None
+        :return: Corpus
+        """
+        if path is None:
+            path = source + CORPUS_SUFFIX
+        stat = os.stat(source)
+        try:
+            corpus = cls(path)
+        except (OSError, ValueError, struct.error):
+            corpus = None
+        if corpus is not None:
+            if corpus.source_size == stat.st_size and corpus.source_mtime == stat.st_mtime_ns:
+                return corpus
+            corpus.close()
+        cls.build(source, path)
+        return cls(path)
+
+    @staticmethod
+    def _write_run(words, directory):
+        """Writes a set of words sorted in corpus order to a new run file,
+        one word per line behind its RUN_KEY_WIDTH key.
+
+        :return: path of the run file
+        """
+        grouped = {}
+        for word in words:
+            key = (len(word), len(set(word)))
+            group = grouped.get(key)
+            if group is None:
+                group = grouped[key] = []
+            group.append(word)
+        run_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".run", delete=False)
+        with run_file:
+            for key in sorted(grouped):
+                group = grouped.pop(key)
+                group.sort()
+                prefix = "\n{:04x}{:04x}".format(*key)
+                run_file.write(prefix[1:])
+                run_file.write(prefix.join(group))
+                run_file.write("\n")
+        return run_file.name
+
+    @staticmethod
+    def _iter_runs(paths):
+        """Yields the lines of sorted run files merged in corpus order,
+        duplicates included."""
+        with contextlib.ExitStack() as stack:
+            run_files = [stack.enter_context(open(run_path, encoding="utf-8")) for run_path in paths]
+            yield from heapq.merge(*run_files) if len(run_files) > 1 else run_files[0]
+
+    @classmethod
+    def _merge_runs(cls, paths, directory):
+        """Merges run files BUILD_MERGE_WIDTH at a time until at most
+        BUILD_MERGE_WIDTH are left, so the final merge never holds more
+        files open than that.
+
+        :return: list of paths of the remaining run files
+        """
+        while len(paths) > BUILD_MERGE_WIDTH:
+            merged = []
+            for start in range(0, len(paths), BUILD_MERGE_WIDTH):
+                group = paths[start:start + BUILD_MERGE_WIDTH]
+                run_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".run",
+                                                       delete=False)
+                with run_file:
+                    run_file.writelines(cls._iter_runs(group))
+                for run_path in group:
+                    os.remove(run_path)
+                merged.append(run_file.name)
+            paths = merged
+        return paths
+
+    @classmethod
+    def build(cls, source, path):
+        """Compiles the words file at source into a corpus file at path.
+
+        The build is an external merge sort bounded in memory: words are
+        deduplicated and sorted BUILD_RUN_WORDS at a time into run files,
+        the runs are merged into a stream in corpus order that is
+        deduplicated again, and the stream is written out to separate
+        offset and data files that are finally concatenated behind the
+        header and bucket table. All intermediate files live in a temporary
+        directory next to path. The corpus is written to a uniquely named
+        temporary file first and then moved into place, so readers never
+        see a partial corpus and concurrent builds do not collide.
+
+        :param source: path to the text file of words (one per line)
+        :param path: path of the compiled corpus
+        :return: number of words in the corpus
+        """
+        stat = os.stat(source)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as directory:
+            runs = []
+            words = set()
+            with open(source, "r", encoding="utf-8", errors="replace") as source_file:
+                for line in source_file:
+                    word = normalize_word(line)
+                    if word is not None:
+                        words.add(word)
+                        if len(words) >= BUILD_RUN_WORDS:
+                            runs.append(cls._write_run(words, directory))
+                            words = set()
+            if words or not runs:
+                runs.append(cls._write_run(words, directory))
+            del words
+            runs = cls._merge_runs(runs, directory)
+
+            buckets = []
+            num_words = 0
+            offsets_path = os.path.join(directory, "offsets")
+            data_path = os.path.join(directory, "data")
+            with open(offsets_path, "wb") as offsets_file, open(data_path, "wb") as data_file:
+                offset = 0
+                previous = None
+                lines = cls._iter_runs(runs)
+                for chunk in iter(lambda: list(itertools.islice(lines, BUILD_RUN_WORDS)), []):
+                    words = []
+                    for line in chunk:
+                        if line == previous:
+                            continue
+                        previous = line
+                        key = line[:RUN_KEY_WIDTH]
+                        if not buckets or buckets[-1][0] != key:
+                            buckets.append([key, num_words + len(words), 0])
+                        buckets[-1][2] += 1
+                        words.append(line[RUN_KEY_WIDTH:-1].encode("utf-8"))
+                    num_words += len(words)
+                    data_file.write(b"".join(words))
+                    # the offset after the chunk's last word starts the next chunk
+                    offsets = array('Q', itertools.accumulate(map(len, words), initial=offset))
+                    offset = offsets.pop()
+                    offsets_file.write(cls._offset_bytes(offsets))
+                offsets_file.write(cls._offset_bytes(array('Q', [offset])))
+
+            with _replacing_file(path) as corpus_file:
+                corpus_file.write(CORPUS_HEADER.pack(CORPUS_MAGIC, stat.st_size, stat.st_mtime_ns, num_words,
+                                                     len(buckets)))
+                for key, start, count in buckets:
+                    corpus_file.write(CORPUS_BUCKET.pack(int(key[:4], 16), int(key[4:], 16), start, count))
+                for part_path in (offsets_path, data_path):
+                    with open(part_path, "rb") as part_file:
+                        shutil.copyfileobj(part_file, corpus_file, INDEX_CHUNK_SIZE)
+        return num_words
+
+    @staticmethod
+    def _offset_bytes(offsets):
+        """:return: offsets as little-endian bytes"""
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        return offsets.tobytes()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("corpus index out of range")
+        start = self.data_start + self.offsets[index]
+        end = self.data_start + self.offsets[index + 1]
+        return self.map[start:end].decode("utf-8")
+
+    def text(self, start, count):
+        """:return: the words start to start + count - 1 run together in one string"""
+        return self.map[self.data_start + self.offsets[start]:
+                        self.data_start + self.offsets[start + count]].decode("utf-8")
+
+    @property
+    def difficulty(self):
+        """DifficultyIndex of the corpus's words, None when they have not
+        been rated (see rate_words) or the ratings are out of date."""
+        if self._difficulty is None:
+            try:
+                difficulty = DifficultyIndex(self.path + DIFFICULTY_SUFFIX)
+            except (OSError, ValueError, struct.error):
+                return None
+            if not difficulty.matches(self):
+                difficulty.close()
+                return None
+            self._difficulty = difficulty
+        return self._difficulty
+
+    def _ranges(self, length, letters):
+        """:return: list of (start, count) index ranges of the words with the
+        given length and number of distinct letters (None for any)"""
+        if length is not None and letters is not None:
+            ranges = [self.buckets.get((length, letters), (0, 0))]
+        elif length is not None:
+            ranges = [self.by_length.get(length, (0, 0))]
+        elif letters is not None:
+            ranges = self.by_letters.get(letters, [])
+        else:
+            ranges = [(0, len(self))]
+        return [(start, count) for start, count in ranges if count]
+
+    @staticmethod
+    def _index_in(ranges, pick):
+        """:return: index of the pick-th word of ranges"""
+        for start, count in ranges:
+            if pick < count:
+                return start + pick
+            pick -= count
+        raise IndexError("pick out of range")
+
+    def random_word(self, length=None, letters=None, tier=None, rng=random):
+        """Picks a random word, optionally of a given length, number of
+        distinct letters and difficulty tier. A tier is found by drawing
+        words until one is rated in it, falling back to collecting every
+        matching word for tiers too rare to be hit that way.
+
+        :param length: required word length, any when None
+        :param letters: required number of distinct letters, any when None
+        :param tier: name of a tier in DIFFICULTY_TIERS, any when None
+        :param rng: random.Random (or the random module) to draw from
+        :return: a word from the corpus
+        """
+        ranges = self._ranges(length, letters)
+        total = sum(count for _, count in ranges)
+        if not total:
+            raise ValueError("no words of length {} with {} distinct letters".format(
+                "any" if length is None else length, "any" if letters is None else letters))
+        if tier is None:
+            return self[self._index_in(ranges, rng.randrange(total))]
+
+        difficulty = self.difficulty
+        if difficulty is None:
+            raise ValueError("the words have no difficulty ratings, rate them with rate_words first")
+        low, high = DIFFICULTY_TIERS[tier]
+        ratings = difficulty.ratings
+        for _ in range(TIER_SAMPLE_TRIES):
+            index = self._index_in(ranges, rng.randrange(total))
+            if low <= ratings[index] <= high:
+                return self[index]
+        matches = [index for start, count in ranges for index in range(start, start + count)
+                   if low <= ratings[index] <= high]
+        if not matches:
+            raise ValueError("no {} words of length {} with {} distinct letters".format(
+                tier, "any" if length is None else length, "any" if letters is None else letters))
+        return self[rng.choice(matches)]
+
+    def close(self):
+        """Releases the memory map and the file.
+
+        :return: None
+        """
+        if getattr(self, "_difficulty", None) is not None:
+            self._difficulty.close()
+            self._difficulty = None
+        if getattr(self, "_view", None) is not None:
+            if isinstance(self.offsets, memoryview):
+                self.offsets.release()
+            self._view.release()
+            self._view = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def is_stream_source(source):
+    """:return: True when source is read as a stream rather than compiled
+    into a Corpus: stdin ("-"), a compressed file or a directory of shards"""
+    return (source == STDIN_SOURCE or os.path.splitext(source)[1] in COMPRESSED_OPENERS
+            or os.path.isdir(source))
+
+
+def iter_source_lines(source):
+    """Yields the lines of a words source in one pass without loading it:
+    stdin for "-", a .gz or .bz2 file decompressed on the fly, every file
+    of a directory (recursively, in name order) or a plain text file.
+
+    :param source: "-" or a path
+    :return: generator of lines
+    """
+    if source == STDIN_SOURCE:
+        yield from sys.stdin
+    elif os.path.isdir(source):
+        for directory, subdirectories, filenames in os.walk(source):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                yield from iter_source_lines(os.path.join(directory, filename))
+    else:
+        opener = COMPRESSED_OPENERS.get(os.path.splitext(source)[1], open)
+        with opener(source, "rt", encoding="utf-8", errors="replace") as source_file:
+            yield from source_file
+
+
+def iter_words(source, length=None, letters=None):
+    """Yields the words of a source normalized as for the corpus,
+    optionally only those of a given length and/or number of distinct
+    letters.
+
+    :param source: "-" or a path, see iter_source_lines
+    :return: generator of words
+    """
+    for line in iter_source_lines(source):
+        word = normalize_word(line)
+        if (word is not None and (length is None or len(word) == length)
+                and (letters is None or len(set(word)) == letters)):
+            yield word
+
+
+def _open_unit(rng):
+    """:return: a uniform random number in (0, 1)"""
+    while True:
+        number = rng.random()
+        if number:
+            return number
+
+
+def reservoir_sample(items, k, rng=random):
+    """Draws k items uniformly without replacement from an iterable of
+    unknown length in one pass, keeping only k items in memory. Rather than
+    drawing a random number per item, the number of items to skip before
+    the next replacement is drawn directly (Li's algorithm L), so long
+    streams are skipped through with islice.
+
+    :param items: iterable to sample from
+    :param k: sample size
+    :param rng: random.Random (or the random module) to draw from
+    :return: list of min(k, number of items) items in random order
+    """
+    iterator = iter(items)
+    end = object()
+    reservoir = list(itertools.islice(iterator, k))
+    if len(reservoir) == k and k:
+        weight = math.exp(math.log(_open_unit(rng)) / k)
+        while True:
+            skip = int(math.log(_open_unit(rng)) / math.log1p(-weight)) if weight < 1.0 else 0
+            item = next(itertools.islice(iterator, skip, None), end)
+            if item is end:
+                break
+            reservoir[rng.randrange(k)] = item
+            weight *= math.exp(math.log(_open_unit(rng)) / k)
+    rng.shuffle(reservoir)
+    return reservoir
+
+
+class WordStream:
+    """Words of a streaming source (see iter_source_lines), picked by
+    reservoir sampling in constant memory. Without a sample size every
+    pick makes its own pass over the source; with one, sample_size words
+    are sampled in a single pass up front and every pick draws from them,
+    so a whole session costs one pass. Stdin can only be read once and is
+    always pre-sampled.
+    """
+
+    def __init__(self, source, sample_size=None, rng=random):
+        """
+        :param source: "-" or a path, see iter_source_lines
+        :param sample_size: number of words to pre-sample, None to pass over the source per pick
+        :param rng: random.Random (or the random module) to draw from
+        """
+        if source == STDIN_SOURCE and sample_size is None:
+            sample_size = STDIN_SAMPLE_SIZE
+        if source != STDIN_SOURCE and not os.path.exists(source):
+            raise FileNotFoundError("No such file or directory: {!r}".format(source))
+        self.source = source
+        self.rng = rng
+        self.sample = None
+        if sample_size is not None:
+            self.sample = reservoir_sample(iter_words(source), sample_size, rng)
+            self.empty = not self.sample
+        else:
+            # reading the first word reports an unreadable source up front
+            self.empty = next(iter_words(source), None) is None
+
+    def __iter__(self):
+        if self.sample is not None:
+            return iter(self.sample)
+        return iter_words(self.source)
+
+    def __bool__(self):
+        return not self.empty
+
+    def random_word(self, length=None, letters=None, tier=None, rng=None):
+        """Picks a random word, optionally of a given length and/or number
+        of distinct letters.
+
+        :param length: required word length, any when None
+        :param letters: required number of distinct letters, any when None
+        :param tier: must be None, streamed words are not rated
+        :param rng: random.Random (or the random module) to draw from, the stream's when None
+        :return: a word from the source (or the pre-sampled words)
+        """
+        if tier is not None:
+            raise ValueError("streamed words have no difficulty ratings, compile them into a corpus first")
+        rng = rng or self.rng
+        if self.sample is not None and length is None and letters is None:
+            words = self.sample
+        elif self.sample is not None:
+            words = [word for word in self.sample if (length is None or len(word) == length)
+                     and (letters is None or len(set(word)) == letters)]
+        else:
+            words = reservoir_sample(iter_words(self.source, length, letters), 1, rng)
+        if not words:
+            raise ValueError("no words of length {} with {} distinct letters".format(
+                "any" if length is None else length, "any" if letters is None else letters))
+        return rng.choice(words)
+
+    def close(self):
+        """Drops the pre-sampled words.
+
+        :return: None
+        """
+        self.sample = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_word(words, length=None, letters=None, tier=None):
     """Selects a single word randomly from words list and returns it.
 
-    :param words: list of strings
+    :param words: list of strings, or any sequence of words such as a WordIndex or Corpus
+    :param length: word length to pick from (Corpus only), any when None
+    :param letters: number of distinct letters to pick from (Corpus only), any when None
+    :param tier: difficulty tier in DIFFICULTY_TIERS to pick from (rated Corpus only), any when None
     :return word: string from words list
     """
+    if length is not None or letters is not None or tier is not None or isinstance(words, WordStream):
+        return words.random_word(length, letters, tier)
     word_index = random.randrange(0, len(words))
     word = words[word_index]
     return word
@@ -194,35 +896,88 @@ def is_game_complete():
         return True
 
 
-def run_guessing_game(words_filepath):
+def load_words(words_filepath, sample_size=None):
+    """Opens the words at words_filepath for random selection: the compiled
+    Corpus, built when needed, or a WordIndex of the text file when the
+    corpus cannot be written next to it. Streaming sources (stdin, .gz and
+    .bz2 files, directories), and any source when sample_size is given,
+    are read through a WordStream instead.
+
+    :param words_filepath: the location of the file of words for the game, "-" for stdin
+    :param sample_size: number of words to pre-sample for the session, None to pick from all words
+    :return: Corpus, WordIndex or WordStream
+    """
+    if sample_size is not None or is_stream_source(words_filepath):
+        return WordStream(words_filepath, sample_size)
+    try:
+        return Corpus.open(words_filepath)
+    except (FileNotFoundError, IsADirectoryError):
+        raise
+    except OSError:
+        return WordIndex(words_filepath)
+
+
+def run_guessing_game(words_filepath, tier=None, sample_size=None):
     """Controls running The Guessing Game. This includes parsing
     the words file and executing multiple rounds of the game.
 
-    :param words_filepath: the location of the file of words for the game
+    :param words_filepath: the location of the file of words for the game, "-" for stdin
+    :param tier: difficulty tier in DIFFICULTY_TIERS to draw words from, any when None
+    :param sample_size: number of words to pre-sample for the session in one pass, None to pick from all words
     :return: None
     """
     try:
-        words_list = read_words(words_filepath)
-    except FileNotFoundError:
+        words_list = load_words(words_filepath, sample_size)
+    except (FileNotFoundError, IsADirectoryError):
         print("The provided file location is not valid. Please enter a valid path to a file.")
         return False
+    except (OSError, EOFError) as error:
+        print("The provided file could not be read: {}".format(error))
+        return False
+    if words_filepath == STDIN_SOURCE and not sys.stdin.isatty():
+        # the words used up stdin, read guesses from the terminal instead
+        try:
+            sys.stdin = open("/dev/tty")
+        except OSError:
+            pass
+    if not words_list:
+        words_list.close()
+        print("The provided file does not contain any words.")
+        return False
+    if tier is not None and getattr(words_list, "difficulty", None) is None:
+        words_list.close()
+        print("The words have not been rated for difficulty yet.")
+        return False
     print("Welcome to The Guessing Game!")
     another_game = None
     while another_game != True:
-        targeted_word = get_word(words_list)
-        word_list = blank_chars(targeted_word)
-        misses_list = []
+        try:
+            targeted_word = get_word(words_list, tier=tier)
+        except ValueError as error:
+            print(error)
+            break
+        game_round = Round(targeted_word)
         round_status = None
         while round_status != True:
-            display_game_state(word_list, misses_list)
+            display_game_state(game_round.chars, game_round.misses)
             guess = get_guess()
-            positions = check_guess(targeted_word, guess)
-            update_state(word_list, misses_list, guess, positions)
-            round_status = is_round_complete(word_list, misses_list)
-        display_game_state(targeted_word, misses_list)
+            positions = game_round.check_guess(guess)
+            game_round.update_state(guess, positions)
+            round_status = is_round_complete(game_round.chars, game_round.misses, game_round.blanks)
+        display_game_state(targeted_word, game_round.misses)
         another_game = is_game_complete()
     if another_game == True:
         print("\nGoodbye.")
+    words_list.close()
+
+
+def render_game_state(chars, misses):
+    """
+    Returns the text display_game_state shows for the current state of the
+    game, without the final line break print adds.
+    """
+
+    return "\n{}\n\nWord:\t{}\n\nMisses:\t{}\n".format('=' * BORDER_LENGTH, space_chars(chars), "".join(misses))
 
 
 def display_game_state(chars, misses):
@@ -231,16 +986,375 @@ def display_game_state(chars, misses):
     and the list of misses.
     """
 
-    print()
-    print('=' * BORDER_LENGTH)
-    print()
+    print(render_game_state(chars, misses))
+
+
+
+class LengthIndex:
+    """Bitsets over the dictionary words of one length: bit n stands for
+    words[n]. at[letter][i] has the bits of the words with letter at
+    position i, and containing[letter] those of the words with letter
+    anywhere."""
+
+    def __init__(self, words):
+        """
+        :param words: list of words, all of the same length
+        """
+        self.words = words
+        self.length = len(words[0]) if words else 0
+        self.all = (1 << len(words)) - 1
+        planes = {}
+        num_bytes = (len(words) + 7) // 8
+        for index, word in enumerate(words):
+            byte, bit = index >> 3, 1 << (index & 7)
+            for position, letter in enumerate(word):
+                letter_planes = planes.get(letter)
+                if letter_planes is None:
+                    letter_planes = planes[letter] = [bytearray(num_bytes) for _ in range(self.length)]
+                letter_planes[position][byte] |= bit
+        self.at = {}
+        self.containing = {}
+        for letter, letter_planes in planes.items():
+            self.at[letter] = [int.from_bytes(plane, 'little') for plane in letter_planes]
+            containing = 0
+            for bits in self.at[letter]:
+                containing |= bits
+            self.containing[letter] = containing
+
+    def candidates(self, chars, misses):
+        """Selects the words consistent with the state of a round: revealed
+        letters sit exactly at their revealed positions and nowhere else,
+        and no word contains a missed letter.
+
+        :param chars: a list of characters, '_' for unrevealed positions
+        :param misses: list of guesses not present in target word
+        :return: bitset of the matching words
+        """
+        candidates = self.all
+        for letter in set(chars) - {"_"}:
+            at = self.at.get(letter)
+            if at is None:
+                return 0
+            for position, char in enumerate(chars):
+                if char == letter:
+                    candidates &= at[position]
+                else:
+                    candidates &= ~at[position]
+        for letter in misses:
+            candidates &= ~self.containing.get(letter, 0)
+        return candidates
+
+    def information(self, candidates, letter):
+        """Expected information, in bits, from guessing letter: the entropy
+        of the split of candidates by where letter appears in them.
+
+        :param candidates: bitset of the words still possible
+        :param letter: the letter to score
+        :return: entropy in bits, 0.0 when the guess cannot split the candidates
+        """
+        total = candidates.bit_count()
+        groups = [candidates]
+        for bits in self.at.get(letter, ()):
+            split = []
+            for group in groups:
+                inside = group & bits
+                if inside:
+                    split.append(inside)
+                if inside != group:
+                    split.append(group ^ inside)
+            groups = split
+        entropy = 0.0
+        for group in groups:
+            probability = group.bit_count() / total
+            entropy -= probability * math.log2(probability)
+        return entropy
+
+
+class Solver:
+    """Computer player for the Guessing Game. For the length of the target
+    word it keeps the dictionary words as bitsets (LengthIndex), built on
+    first use of each length, so narrowing the candidates down to the
+    words consistent with chars and misses takes a few big-int ANDs per
+    guessed letter instead of a scan of the dictionary. It then guesses
+    the letter with the most expected information, preferring the letter
+    most likely to be in the word between equally informative ones.
+    """
 
-    print("Word:\t{}\n".format(space_chars(chars)))
-    print("Misses:\t{}\n".format("".join(misses)))
+    def __init__(self, words):
+        """
+        :param words: sequence of dictionary words, such as a Corpus
+        """
+        self.words = words
+        self.indexes = {}
 
+    def index(self, length):
+        """:return: LengthIndex of the dictionary words of the given length"""
+        index = self.indexes.get(length)
+        if index is None:
+            if isinstance(self.words, Corpus):
+                start, count = self.words.by_length.get(length, (0, 0))
+                words = [self.words[i] for i in range(start, start + count)]
+            else:
+                words = [word for word in self.words if len(word) == length]
+            index = self.indexes[length] = LengthIndex(words)
+        return index
+
+    def candidates(self, chars, misses):
+        """:return: list of the dictionary words consistent with chars and misses"""
+        index = self.index(len(chars))
+        candidates = index.candidates(chars, misses)
+        return [word for position, word in enumerate(index.words) if candidates >> position & 1]
+
+    def __call__(self, chars, misses):
+        """Chooses the next guess.
+
+        :param chars: a list of characters, '_' for unrevealed positions
+        :param misses: list of guesses not present in target word
+        :return: a single lower-case character
+        """
+        guessed = set(chars) | set(misses)
+        index = self.index(len(chars))
+        candidates = index.candidates(chars, misses)
+        best = None
+        if candidates:
+            total = candidates.bit_count()
+            best_score = None
+            for letter, containing in index.containing.items():
+                if letter in guessed or not containing & candidates:
+                    continue
+                score = (index.information(candidates, letter), (containing & candidates).bit_count() / total)
+                if best_score is None or score > best_score:
+                    best, best_score = letter, score
+        if best is None:
+            best = next(letter for letter in FALLBACK_LETTERS if letter not in guessed)
+        return best
+
+
+def play_round_headless(word, player):
+    """Plays one round for word without any input or output, under the rules
+    of run_guessing_game, taking guesses from player.
+
+    :param word: target word as a string
+    :param player: callable taking (chars, misses) and returning the next guess
+    :return: (solved, misses) where misses is the list of missed guesses
+    """
+    game_round = Round(word)
+    while True:
+        game_round.guess(player(game_round.chars, game_round.misses))
+        if game_round.blanks == 0:
+            return True, game_round.misses
+        if len(game_round.misses) > MAX_MISSES:
+            return False, game_round.misses
+
+
+class FrequencyPlayer:
+    """Automated player guessing letters in a fixed order, most frequent
+    letter first."""
+
+    def __init__(self, order):
+        """
+        :param order: string of letters, most frequent first
+        """
+        self.order = order
+
+    def __call__(self, chars, misses):
+        guessed = set(chars) | set(misses)
+        for letter in self.order:
+            if letter not in guessed:
+                return letter
+        raise ValueError("every letter of the order has been guessed")
+
+
+def rate_word(word, player):
+    """Rates how hard word is for player.
+
+    :return: misses needed to solve the word, MAX_MISSES + 1 when it was not solved
+    """
+    solved, misses = play_round_headless(word, player)
+    return len(misses) if solved else MAX_MISSES + 1
+
+
+class DifficultyIndex:
+    """Difficulty ratings of the words of a Corpus, one byte per word in
+    corpus order (UNRATED until rated), stored in a file next to the
+    corpus together with the identity of the corpus and the letter order
+    of the player that rated them."""
+
+    def __init__(self, path):
+        """
+        :param path: path to the ratings file
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = DIFFICULTY_HEADER.unpack_from(self.map, 0)
+        if header[0] != DIFFICULTY_MAGIC:
+            self.close()
+            raise ValueError("{} is not a difficulty index".format(path))
+        self.source_size, self.source_mtime, self.num_words, self.max_misses, order_size = header[1:]
+        self.order = self.map[DIFFICULTY_HEADER.size:DIFFICULTY_HEADER.size + order_size].decode("utf-8")
+        self.data_start = DIFFICULTY_HEADER.size + order_size
+        if len(self.map) != self.data_start + self.num_words:
+            self.map.close()
+            self.file.close()
+            raise ValueError("{} is truncated or corrupt".format(path))
+        self.ratings = memoryview(self.map)[self.data_start:self.data_start + self.num_words]
+
+    def matches(self, corpus):
+        """:return: True when the ratings belong to corpus under the current MAX_MISSES"""
+        return (self.source_size == corpus.source_size and self.source_mtime == corpus.source_mtime
+                and self.num_words == len(corpus) and self.max_misses == MAX_MISSES)
+
+    @staticmethod
+    def create(path, corpus, order):
+        """Writes a ratings file for corpus with every word unrated. The
+        file is written to a uniquely named temporary file first and then
+        moved into place, so readers never see a partial file and
+        concurrent runs do not collide.
+
+        :param path: path of the ratings file
+        :param corpus: the Corpus to rate
+        :param order: letter order of the rating player
+        :return: None
+        """
+        order_bytes = order.encode("utf-8")
+        with _replacing_file(path) as ratings_file:
+            ratings_file.write(DIFFICULTY_HEADER.pack(DIFFICULTY_MAGIC, corpus.source_size, corpus.source_mtime,
+                                                      len(corpus), MAX_MISSES, len(order_bytes)))
+            ratings_file.write(order_bytes)
+            unrated = bytes([UNRATED]) * INDEX_CHUNK_SIZE
+            for start in range(0, len(corpus), INDEX_CHUNK_SIZE):
+                ratings_file.write(unrated[:min(INDEX_CHUNK_SIZE, len(corpus) - start)])
+
+    def tier_counts(self):
+        """:return: dict of tier names mapped to the number of words rated in the tier"""
+        ratings = Counter()
+        for start in range(0, self.num_words, INDEX_CHUNK_SIZE):
+            ratings.update(self.ratings[start:start + INDEX_CHUNK_SIZE].tobytes())
+        return {tier: sum(ratings[rating] for rating in range(low, high + 1))
+                for tier, (low, high) in DIFFICULTY_TIERS.items()}
+
+    def close(self):
+        """Releases the memory map and the file.
+
+        :return: None
+        """
+        self.ratings.release()
+        self.map.close()
+        self.file.close()
+
+
+def _count_letters_task(args):
+    """Counts the letters of a range of corpus words in a worker process."""
+    corpus_path, start, count = args
+    with Corpus(corpus_path) as corpus:
+        return Counter(corpus.text(start, count))
+
+
+def _rate_words_task(args):
+    """Rates a range of corpus words in a worker process.
+
+    :return: (start, bytes of ratings)
+    """
+    corpus_path, start, count, order = args
+    player = FrequencyPlayer(order)
+    with Corpus(corpus_path) as corpus:
+        return start, bytes(rate_word(corpus[index], player) for index in range(start, start + count))
+
+
+def rate_words(source, processes=None, chunk_size=20000, progress=None):
+    """Rates every word of the corpus of the words file at source by the
+    misses a FrequencyPlayer needs to solve it, storing the ratings in
+    <corpus>.difficulty for get_word to select by tier.
+
+    The corpus is handed to a pool of worker processes in chunks of
+    chunk_size words; workers map the corpus themselves, so only word
+    ranges and ratings travel between processes. The player's letter order
+    comes from a first parallel pass counting letters over the corpus.
+    Ratings are written to the file as chunks complete, so an interrupted
+    run resumes where it stopped, reusing the stored letter order, as
+    long as the words and MAX_MISSES are unchanged.
+
+    :param source: path to the text file of words (one per line)
+    :param processes: number of worker processes, None for one per CPU, 1 to stay in-process
+    :param chunk_size: number of words handed to a worker at a time
+    :param progress: callable receiving (words rated, total words) as chunks complete
+    :return: path of the ratings file
+    """
+    with Corpus.open(source) as corpus:
+        path = corpus.path + DIFFICULTY_SUFFIX
+        chunks = [(start, min(chunk_size, len(corpus) - start)) for start in range(0, len(corpus), chunk_size)]
+        pool = multiprocessing.Pool(processes) if processes != 1 else None
+        run = pool.imap_unordered if pool is not None else map
+        try:
+            difficulty = corpus.difficulty
+            if difficulty is None:
+                letters = Counter()
+                for counts in run(_count_letters_task, [(corpus.path, start, count) for start, count in chunks]):
+                    letters.update(counts)
+                order = "".join(sorted(letters, key=lambda letter: (-letters[letter], letter)))
+                DifficultyIndex.create(path, corpus, order)
+                difficulty = corpus.difficulty
+            order = difficulty.order
+            pending = [(start, count) for start, count in chunks
+                       if UNRATED in difficulty.ratings[start:start + count].tobytes()]
+            done = len(corpus) - sum(count for _, count in pending)
+
+            with open(path, "r+b") as ratings_file:
+                tasks = [(corpus.path, start, count, order) for start, count in pending]
+                for start, ratings in run(_rate_words_task, tasks):
+                    ratings_file.seek(difficulty.data_start + start)
+                    ratings_file.write(ratings)
+                    ratings_file.flush()
+                    done += len(ratings)
+                    if progress is not None:
+                        progress(done, len(corpus))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    return path
 
 
 def main():
+    """Runs The Guessing Game on the words file given as the last argument,
+    optionally preceded by a difficulty tier (easy, medium or hard) or by
+    "sample K" to play from K words sampled in one pass. WORDS may be "-"
+    for stdin, a .gz or .bz2 file or a directory of word files. With the
+    arguments "solve N WORDS" has the Solver play N rounds and
+    prints how it did, or with "rate WORDS" rates the difficulty of every
+    word (resuming an interrupted run)."""
+    if len(sys.argv) == 3 and sys.argv[1] == "rate":
+        def report(done, total):
+            print("\rRated {} of {} words".format(done, total), end="", flush=True)
+
+        path = rate_words(sys.argv[2], progress=report)
+        print()
+        with Corpus.open(sys.argv[2]) as words:
+            for tier, count in words.difficulty.tier_counts().items():
+                print("{}: {} words".format(tier, count))
+        print("Ratings written to {}".format(path))
+        return
+    if len(sys.argv) == 3 and sys.argv[1] in DIFFICULTY_TIERS:
+        run_guessing_game(sys.argv[2], sys.argv[1])
+        return
+    if len(sys.argv) == 4 and sys.argv[1] == "sample":
+        run_guessing_game(sys.argv[3], sample_size=int(sys.argv[2]))
+        return
+
+    if len(sys.argv) == 4 and sys.argv[1] == "solve":
+        with load_words(sys.argv[3]) as words:
+            solver = Solver(words)
+            solved = 0
+            total_misses = 0
+            for _ in range(int(sys.argv[2])):
+                round_solved, misses = play_round_headless(get_word(words), solver)
+                solved += round_solved
+                total_misses += len(misses)
+            print("Solved {} of {} rounds, {:.2f} misses per round.".format(
+                solved, sys.argv[2], total_misses / int(sys.argv[2])))
+        return
+
     filepath = sys.argv[-1]
 
     # call run_guessing_game() with filepath as argument and remove pass below
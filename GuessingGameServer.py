@@ -0,0 +1,294 @@
+# Guessing Game
+# Asyncio line-protocol server hosting one Guessing Game session per connection
+
+import asyncio
+import sys
+import time
+
+from GuessingGame import FALLBACK_LETTERS, FrequencyPlayer, Round, SINGLE_CHAR_LENGTH, WordStream, get_word, \
+    is_stream_source, load_words, render_game_state
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8008
+GUESS_PROMPT = "Guess:"
+AGAIN_PROMPT = "Play again (Y/N)?"
+PROMPTS = (GUESS_PROMPT, AGAIN_PROMPT)
+# words sampled once at startup from stdin, compressed files and directories,
+# which cannot be picked from without a pass over the whole source
+SERVER_SAMPLE_SIZE = 100000
+
+
+async def _send(writer, lines):
+    """Writes lines to the client, one per line, and waits for the
+    transport to drain so a slow client cannot buffer unbounded output.
+
+    :param writer: asyncio StreamWriter of the connection
+    :param lines: strings to send
+    :return: None
+    """
+    writer.write(('\n'.join(lines) + '\n').encode())
+    await writer.drain()
+
+
+async def _read_line(reader):
+    """Reads one line from the client.
+
+    :param reader: asyncio StreamReader of the connection
+    :return: the line without its line ending, None once the client disconnects
+    """
+    try:
+        line = await reader.readline()
+    except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+        return None
+    if not line:
+        return None
+    return line.decode(errors='replace').strip()
+
+
+async def play_session(reader, writer, words):
+    """Plays Guessing Game rounds over one connection until the client
+    declines another round, sends QUIT or disconnects. This is
+    run_guessing_game with guesses read from the socket instead of
+    get_guess and the game state sent back instead of printed. Every
+    session keeps its own Round; words is only read.
+
+    :param reader: asyncio StreamReader of the connection
+    :param writer: asyncio StreamWriter of the connection
+    :param words: the shared words to draw from, as returned by open_words
+    :return: number of rounds completed
+    """
+    rounds_played = 0
+    try:
+        await _send(writer, ["Welcome to The Guessing Game!"])
+        while True:
+            game_round = Round(get_word(words))
+            await _send(writer, [render_game_state(game_round.chars, game_round.misses), GUESS_PROMPT])
+
+            while not (game_round.is_solved() or game_round.is_lost()):
+                line = await _read_line(reader)
+                if line is None or line.upper() == "QUIT":
+                    return rounds_played
+                if len(line) != SINGLE_CHAR_LENGTH or not line.isalpha():
+                    await _send(writer, [GUESS_PROMPT])
+                    continue
+
+                game_round.guess(line.lower())
+                if game_round.is_solved():
+                    lines = ["", "YOU GOT IT!", render_game_state(game_round.word, game_round.misses)]
+                elif game_round.is_lost():
+                    lines = ["", "SORRY! NO GUESSES LEFT.", render_game_state(game_round.word, game_round.misses)]
+                else:
+                    lines = [render_game_state(game_round.chars, game_round.misses), GUESS_PROMPT]
+                await _send(writer, lines)
+
+            rounds_played += 1
+            await _send(writer, [AGAIN_PROMPT])
+            answer = await _read_line(reader)
+            while answer is not None and answer not in ("Y", "N", "y", "n"):
+                await _send(writer, [AGAIN_PROMPT])
+                answer = await _read_line(reader)
+            if answer is None:
+                return rounds_played
+            if answer in ("N", "n"):
+                await _send(writer, ["Goodbye."])
+                return rounds_played
+    except ConnectionError:
+        return rounds_played
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def start_server(words, host=DEFAULT_HOST, port=DEFAULT_PORT, backlog=4096):
+    """Starts listening for Guessing Game clients. Every connection is
+    served by its own play_session task on the running event loop, all of
+    them drawing from the same words, so a Corpus is mapped once for the
+    whole server.
+
+    :param words: words to draw from, as returned by open_words
+    :param host: interface to listen on
+    :param port: TCP port, 0 to pick a free one
+    :param backlog: listen queue length, large enough for bursts of connects
+    :return: the asyncio Server
+    """
+    if isinstance(words, WordStream) and words.sample is None:
+        raise ValueError("streamed words must be pre-sampled to be served, see open_words")
+
+    async def handle(reader, writer):
+        await play_session(reader, writer, words)
+
+    return await asyncio.start_server(handle, host, port, backlog=backlog)
+
+
+async def serve(words, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Runs the Guessing Game server until cancelled.
+
+    :return: None
+    """
+    server = await start_server(words, host, port)
+    async with server:
+        print("Serving The Guessing Game on {}".format(
+            ', '.join('{}:{}'.format(*sock.getsockname()[:2]) for sock in server.sockets)))
+        await server.serve_forever()
+
+
+class Client:
+    """Scripted Guessing Game client for testing the server. It reads
+    server output up to the next prompt, parses the word and misses from
+    the game state and answers with the guess of player, using the same
+    player protocol as GuessingGame.play_round_headless: player is called
+    with (chars, misses) and returns the letter to guess. The time from
+    sending a guess to reading the next prompt is kept per guess.
+    """
+
+    def __init__(self, player, rounds=1):
+        self.player = player
+        self.rounds = rounds
+        self.latencies = []
+        self.solved = 0
+        self.lost = 0
+
+    async def _read_until_prompt(self, reader):
+        """Reads lines until the server asks for input.
+
+        :return: (lines read, prompt) where prompt is None on disconnect
+        """
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return lines, None
+            line = line.decode().rstrip('\n')
+            if line in PROMPTS:
+                return lines, line
+            lines.append(line)
+
+    @staticmethod
+    def _parse_state(lines):
+        """:return: (chars, misses) of the last game state in lines"""
+        chars = misses = None
+        for line in lines:
+            if line.startswith("Word:\t"):
+                chars = line[len("Word:\t"):].split(" ")
+            elif line.startswith("Misses:\t"):
+                misses = list(line[len("Misses:\t"):])
+        return chars, misses
+
+    async def run(self, host, port):
+        """Connects to the server and plays self.rounds rounds.
+
+        :return: self
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            rounds_left = self.rounds
+            sent = None
+            while True:
+                lines, prompt = await self._read_until_prompt(reader)
+                if sent is not None:
+                    self.latencies.append(time.perf_counter() - sent)
+                    sent = None
+                if "YOU GOT IT!" in lines:
+                    self.solved += 1
+                elif "SORRY! NO GUESSES LEFT." in lines:
+                    self.lost += 1
+                if prompt is None:
+                    break
+                if prompt == AGAIN_PROMPT:
+                    rounds_left -= 1
+                    writer.write(b"Y\n" if rounds_left > 0 else b"N\n")
+                    continue
+                chars, misses = self._parse_state(lines)
+                writer.write("{}\n".format(self.player(chars, misses)).encode())
+                sent = time.perf_counter()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+        return self
+
+
+def _percentile(values, fraction):
+    """:return: the value below which fraction of the sorted values lie, 0.0 when there are none"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def load_test(words, num_clients, rounds=1, host=DEFAULT_HOST, port=0, player=None):
+    """Starts a server in this process and plays num_clients simultaneous
+    sessions against it.
+
+    :param words: words the server draws from, as returned by open_words
+    :param num_clients: number of concurrent connections
+    :param rounds: rounds played per connection
+    :param port: server port, 0 to pick a free one
+    :param player: player answering guesses, a FrequencyPlayer in FALLBACK_LETTERS order when None
+    :return: dict with clients, rounds, solved, guesses, seconds, rounds_per_second and
+        the mean, median and 99th percentile guess latency in milliseconds
+    """
+    if player is None:
+        player = FrequencyPlayer(FALLBACK_LETTERS)
+    server = await start_server(words, host, port)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        start = time.perf_counter()
+        clients = await asyncio.gather(*(Client(player, rounds).run(host, port) for _ in range(num_clients)))
+        seconds = time.perf_counter() - start
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    rounds_played = sum(client.solved + client.lost for client in clients)
+    return {
+        "clients": num_clients,
+        "rounds": rounds_played,
+        "solved": sum(client.solved for client in clients),
+        "guesses": len(latencies),
+        "seconds": seconds,
+        "rounds_per_second": rounds_played / seconds if seconds else 0.0,
+        "latency_mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        "latency_p50_ms": 1000 * _percentile(latencies, 0.5),
+        "latency_p99_ms": 1000 * _percentile(latencies, 0.99),
+    }
+
+
+def open_words(words_filepath, sample_size=SERVER_SAMPLE_SIZE):
+    """Opens the words the server draws from: a Corpus (or WordIndex) for
+    plain words files, and for streaming sources sample_size words sampled
+    in one pass at startup, so no round ever reads the source.
+
+    :param words_filepath: the location of the file of words, "-" for stdin
+    :param sample_size: number of words sampled from a streaming source
+    :return: Corpus, WordIndex or WordStream
+    """
+    return load_words(words_filepath, sample_size if is_stream_source(words_filepath) else None)
+
+
+def main():
+    """Serves The Guessing Game with the words file given as the first
+    argument on DEFAULT_PORT (or the port given as the second argument),
+    or with the arguments "loadtest N WORDS [ROUNDS]" plays N concurrent
+    scripted sessions against an in-process server and prints the results."""
+
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "loadtest":
+        rounds = int(sys.argv[4]) if len(sys.argv) == 5 else 1
+        with open_words(sys.argv[3]) as words:
+            results = asyncio.run(load_test(words, int(sys.argv[2]), rounds))
+        for key, value in results.items():
+            print("{}: {}".format(key, round(value, 2) if isinstance(value, float) else value))
+    elif len(sys.argv) in (2, 3):
+        port = int(sys.argv[2]) if len(sys.argv) == 3 else DEFAULT_PORT
+        with open_words(sys.argv[1]) as words:
+            try:
+                asyncio.run(serve(words, port=port))
+            except KeyboardInterrupt:
+                print("Goodbye.")
+    else:
+        print("usage: GuessingGameServer.py WORDS [PORT] | loadtest N WORDS [ROUNDS]")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@
 # Tic-tac-toe
 # Date due: 2020-11-20
 
+import sys
+from functools import lru_cache
 
 MAX_ROUNDS = 9
 NUM_ROWS = 3
@@ -9,6 +11,34 @@ NUM_COLS = 3
 NUM_POSITIONS = 9
 ROW_POS = 0
 COL_POS = 1
+EMPTY = ' '
+# board positions in row-major order, the order of the characters of a board key
+POSITIONS = [(row, col) for row in range(NUM_ROWS) for col in range(NUM_COLS)]
+
+
+def _symmetries():
+    """Lists the 8 symmetries of the board (4 rotations, each with and
+    without a reflection) as permutations of POSITIONS indexes: entry i of
+    a permutation is the index of the position mapped onto position i.
+
+    :return: list of tuples of integers
+    """
+    index = {position: i for i, position in enumerate(POSITIONS)}
+    symmetries = []
+    for reflect in (False, True):
+        for turns in range(4):
+            permutation = []
+            for row, col in POSITIONS:
+                if reflect:
+                    col = NUM_COLS - 1 - col
+                for _ in range(turns):
+                    row, col = col, NUM_ROWS - 1 - row
+                permutation.append(index[row, col])
+            symmetries.append(tuple(permutation))
+    return symmetries
+
+
+SYMMETRIES = _symmetries()
 
 
 def reset_board(board):
@@ -140,12 +170,93 @@ def is_game_complete(board):
     return winning_configuration
 
 
-def play_tic_tac_toe(board):
+def canonical_key(board):
+    """Returns the key of the board under the symmetry that makes it
+    smallest, so the 8 rotations and reflections of a position share one
+    key, together with that symmetry.
+
+    :param board: a dict of (row, col) tuple keys and string values
+    :return: (key, symmetry) where key[i] is board[POSITIONS[symmetry[i]]]
+    """
+    values = [board[position] for position in POSITIONS]
+    return min(("".join(values[i] for i in symmetry), symmetry) for symmetry in SYMMETRIES)
+
+
+def _solve(board, player_mark, table):
+    """Scores board with player_mark to move by minimax under perfect play
+    of both sides, recording the score and best move of every position in
+    table under its canonical key, so each position is searched once
+    however it was reached and in whichever orientation.
+
+    :param board: a dict of (row, col) tuple keys and string values, restored before returning
+    :param player_mark: 'X' or 'O', the player to move
+    :param table: dict of canonical keys mapped to (score, best move as an index into the canonical key)
+    :return: score for player_mark: positive for a win (higher the sooner), 0 for a draw, negative for a loss
+    """
+    key, symmetry = canonical_key(board)
+    entry = table.get(key)
+    if entry is not None:
+        return entry[0]
+    other_mark = "O" if player_mark == "X" else "X"
+    empty = [i for i, position in enumerate(POSITIONS) if board[position] == EMPTY]
+    best_score = best_move = None
+    for move in empty:
+        position = POSITIONS[move]
+        update_board(board, player_mark, position)
+        if is_game_complete(board):
+            score = len(empty)
+        elif len(empty) == 1:
+            score = 0
+        else:
+            score = -_solve(board, other_mark, table)
+        update_board(board, EMPTY, position)
+        if best_score is None or score > best_score:
+            best_score, best_move = score, move
+    table[key] = (best_score, symmetry.index(best_move))
+    return best_score
+
+
+@lru_cache(maxsize=None)
+def get_solution():
+    """Solves Tic-tac-toe from the empty board once, the table being kept
+    for every later call.
+
+    :return: dict of canonical keys (see canonical_key) of every position
+        reachable with the game still open mapped to (score for the player
+        to move, best move as an index into the key)
+    """
+    board = {position: EMPTY for position in POSITIONS}
+    table = {}
+    _solve(board, "X", table)
+    return table
+
+
+def get_computer_move(board):
+    """Returns a best position for the player to move on board under
+    perfect play, looked up in the solution table.
+
+    :param board: a dict of (row, col) tuple keys and string values, with the game still open
+    :return: (row, col) tuple of integers
+    """
+    key, symmetry = canonical_key(board)
+    entry = get_solution().get(key)
+    if entry is None:
+        # positions no game between the two players can reach, such as
+        # two marks of the same player in a row
+        player_mark = "X" if key.count("X") == key.count("O") else "O"
+        table = {}
+        _solve(dict(board), player_mark, table)
+        entry = table[key]
+    return POSITIONS[symmetry[entry[1]]]
+
+
+def play_tic_tac_toe(board, computer_mark=None):
     """Controls Tic-tac-toe games. This includes prompting player's for
     position choices, checking for winning game configurations, and outputting
     the outcome of a game.
 
     :param board: a dict of (row, col) tuple keys and string values
+    :param computer_mark: 'X' or 'O' for the mark played by the computer, None for two human players
     :return: None
     """
     print("Let's Play Tic-tac-toe!\n")
@@ -156,7 +267,11 @@ def play_tic_tac_toe(board):
         while status == False and round < MAX_ROUNDS:
             display_board(board)
             player = get_current_player(round)
-            position = get_position_choice(board, player)
+            if player == computer_mark:
+                position = get_computer_move(board)
+                print("{} plays row {}, column {}.\n".format(player, position[ROW_POS], position[COL_POS]))
+            else:
+                position = get_position_choice(board, player)
             update_board(board, player, position)
             status = is_game_complete(board)
             if status == False:
@@ -209,6 +324,9 @@ def display_board(board):
 
 
 def main():
+    """Plays Tic-tac-toe between two players, or with the argument
+    "computer" against the computer, which plays O unless the mark it
+    should play follows ("computer X")."""
 
     board = {
         (0, 0): ' ', (0, 1): ' ', (0, 2): ' ',
@@ -217,7 +335,11 @@ def main():
     }
 
     # call play_tic_tac_toe() with board as argument and remove pass below
-    play_tic_tac_toe(board)
+    if len(sys.argv) >= 2 and sys.argv[1] == "computer":
+        computer_mark = sys.argv[2].upper() if len(sys.argv) == 3 else "O"
+        play_tic_tac_toe(board, computer_mark)
+    else:
+        play_tic_tac_toe(board)
 
 
 if __name__ == '__main__':